@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+# Space Invaders - 2-Playered
+# Asset bundle. Every image (decoded to raw pixels), the font and every sound
+# (decoded to the mixer's sample format) packed into one file, which the game
+# maps into memory instead of opening and decoding each asset on its own. The
+# game falls back to the source files while the bundle is missing or older
+# than any of them.
+#
+#   python3 assets.py    # rebuild assets.bundle after changing an asset
+
+import io
+import mmap
+import os
+import struct
+
+from pygame import font, image, mixer
+
+BUNDLE_MAGIC = b'SIAB'
+BUNDLE_VERSION = 1
+HEADER = struct.Struct('<4sBihBI')  # magic, version, mixer frequency, size, channels, entries
+ENTRY = struct.Struct('<24sBIIHH4s')  # name, kind, offset, length, width, height, pixel format
+IMAGE, FONT, SOUND = 0, 1, 2
+
+
+def is_fresh(path, sources):
+    # Whether the bundle at path exists and is newer than every source file
+    if not os.path.exists(path):
+        return False
+    built = os.path.getmtime(path)
+    return all(os.path.getmtime(source) <= built for source in sources)
+
+
+def build(path, images, fonts, sounds, mixerFormat):
+    # images {name: Surface}, fonts {name: file bytes}, sounds {name: raw
+    # samples in mixerFormat, (frequency, size, channels)}
+    entries = []
+    for name, surface in sorted(images.items()):
+        entries.append((name, IMAGE, image.tobytes(surface, 'RGBA'), surface.get_size(), 'RGBA'))
+    for name, data in sorted(fonts.items()):
+        entries.append((name, FONT, data, (0, 0), ''))
+    for name, data in sorted(sounds.items()):
+        entries.append((name, SOUND, data, (0, 0), ''))
+    offset = HEADER.size + ENTRY.size * len(entries)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, *(mixerFormat + (len(entries),))))
+        for name, kind, data, (width, height), pixels in entries:
+            f.write(ENTRY.pack(name.encode(), kind, offset, len(data), width, height, pixels.encode()))
+            offset += len(data)
+        for entry in entries:
+            f.write(entry[2])
+    os.replace(path + '.tmp', path)
+
+
+class AssetBundle(object):
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(self.map, 'madvise'):
+            # Read the whole file in at once rather than a page per fault
+            self.map.madvise(mmap.MADV_WILLNEED)
+        magic, version, frequency, size, channels, count = HEADER.unpack_from(self.map)
+        if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+            raise ValueError("{} is not a version {} asset bundle".format(path, BUNDLE_VERSION))
+        self.mixerFormat = (frequency, size, channels)
+        self.entries = {}
+        view = memoryview(self.map)
+        for i in range(count):
+            name, kind, offset, length, width, height, pixels = ENTRY.unpack_from(
+                self.map, HEADER.size + i * ENTRY.size)
+            self.entries[kind, name.rstrip(b'\0').decode()] = (
+                view[offset:offset + length], (width, height), pixels.rstrip(b'\0').decode())
+
+    def has(self, kind, name):
+        return (kind, name) in self.entries
+
+    def image(self, name):
+        # Backed by the map; it is only ever read, or converted to a copy
+        data, size, pixels = self.entries[IMAGE, name]
+        return image.frombuffer(data, size, pixels)
+
+    def font(self, name, size):
+        return font.Font(io.BytesIO(self.entries[FONT, name][0]), size)
+
+    def sound(self, name):
+        # None unless the samples are in the format the mixer was opened with
+        if mixer.get_init() != self.mixerFormat:
+            return None
+        return mixer.Sound(buffer=self.entries[SOUND, name][0])
+
+
+if __name__ == '__main__':
+    import spaceinvaders
+    spaceinvaders.build_bundle()
@@ -0,0 +1,377 @@
+#!/usr/bin/env python
+
+# Space Invaders - 2-Playered
+# Vectorized batch environment: advances many independent headless games in
+# lockstep, with the state of every game held in NumPy arrays.  The rules
+# mirror SpaceInvaders.step in spaceinvaders.py (same timings, speeds, rects
+# and scoring), but randomness comes from one NumPy generator for the batch,
+# so individual games do not reproduce run_headless() seeds. Shields are not
+# modelled; this is the game as played without --shields.
+
+import sys
+import time as ti
+
+import numpy as np
+
+from spaceinvaders import (ENEMY_DEFAULT_POSITION, ENEMY_HEIGHT, ENEMY_MOVE_DOWN, ENEMY_WIDTH,
+                           FRAME_TIME, MARCH_MOVES, MARCH_STEP, MAX_HEADLESS_FRAMES, ROW_SPACING,
+                           SIDE_COLUMNS, EnemiesGroup, parse_mode)
+
+ROWS = 5
+ROW_SCORES = np.array([30, 20, 20, 10, 10])
+MYSTERY_SCORES = np.array([50, 100, 150, 300])
+SHIP_WIDTH, SHIP_HEIGHT, SHIP_Y = 50, 48, 540
+BULLET_WIDTH, BULLET_HEIGHT = 5, 15
+MYSTERY_WIDTH, MYSTERY_HEIGHT, MYSTERY_Y = 75, 35, 45
+# Enemies fire at most every 700 ms and need ~1.8 s to leave the screen
+ENEMY_BULLET_SLOTS = 8
+HUMAN, OTHER = 0, 1
+
+
+def overlap(aPos, aSize, bPos, bSize):
+    # Same strict test as Rect.colliderect, along one axis
+    return (aPos < bPos + bSize) & (bPos < aPos + aSize)
+
+
+class BatchInvaders(object):
+    def __init__(self, size, mode="d", seed=None):
+        self.size = size
+        self.mode = mode
+        self.random = np.random.default_rng(seed)
+        self.columns = SIDE_COLUMNS if mode == "p" else 2 * SIDE_COLUMNS
+        # Lattice offsets of each column/row from the formation origin, as
+        # the EnemiesGroup of the real game has them
+        self.columnX = np.array([EnemiesGroup.column_offset(column) for column in range(self.columns)])
+        self.rowY = np.arange(ROWS) * ROW_SPACING
+        self.reset()
+
+    def reset(self):
+        n = self.size
+        self.currentTime = 0
+        self.frames = 0
+        self.running = np.ones(n, bool)
+        self.enemiesLanded = np.zeros(n, bool)
+        self.gameOver = np.zeros(n, bool)
+
+        # EnemiesGroup
+        self.alive = np.ones((n, ROWS, self.columns), bool)
+        self.originX = np.zeros(n, int)
+        self.originY = np.full(n, ENEMY_DEFAULT_POSITION)
+        self.moveTime = np.full(n, 600)
+        self.enemyDirection = np.ones(n, int)
+        self.moveNumber = np.zeros(n, int)
+        self.enemyTimer = np.zeros(n, int)
+        self.bottom = np.full(n, ENEMY_DEFAULT_POSITION + (ROWS - 1) * ROW_SPACING + ENEMY_HEIGHT)
+        self.leftAliveColumn = np.zeros(n, int)
+        self.rightAliveColumn = np.full(n, self.columns - 1)
+
+        # Ships: column 0 is the human, column 1 the AI
+        self.shipX = np.tile(np.array([200, 600]), (n, 1))
+        self.shipAlive = np.ones((n, 2), bool)
+        self.aiDirection = np.full(n, -1)
+        self.humanLives = np.full(n, 3)
+        self.otherLife = np.ones(n, bool)
+        self.makeNew = np.zeros((n, 2), bool)
+        self.shipTimer = np.zeros(n, int)
+        if self.mode == "p":
+            self.shipAlive[:, OTHER] = False
+            self.otherLife[:] = False
+
+        # Player bullets have one slot per ship since each may only have one in flight
+        self.bulletActive = np.zeros((n, 2), bool)
+        self.bulletX = np.zeros((n, 2), int)
+        self.bulletY = np.zeros((n, 2), int)
+        self.enemyBulletActive = np.zeros((n, ENEMY_BULLET_SLOTS), bool)
+        self.enemyBulletX = np.zeros((n, ENEMY_BULLET_SLOTS), int)
+        self.enemyBulletY = np.zeros((n, ENEMY_BULLET_SLOTS), int)
+        self.shootTimer = np.zeros(n, int)
+
+        # Mystery
+        self.mysteryDirection = np.zeros(n, int)
+        self.mysteryX = np.zeros(n, int)
+        self.mysteryTimer = np.zeros(n, int)
+        self.mysteryPlaySound = np.ones(n, bool)
+        self.new_mystery(np.ones(n, bool))
+
+        # Only the time the last explosion disappears matters to the simulation
+        self.explosionEnd = np.full(n, -1)
+
+        self.playerScore = np.zeros(n, int)
+        self.otherScore = np.zeros(n, int)
+        self.kills = np.zeros((n, 2, 2), int)  # [game, human/AI, left/right]
+
+    def new_mystery(self, mask):
+        direction = self.random.choice(np.array([-1, 1]), self.size)
+        self.mysteryDirection = np.where(mask, direction, self.mysteryDirection)
+        self.mysteryX = np.where(mask, np.where(direction == 1, -80, 880 - MYSTERY_WIDTH),
+                                 self.mysteryX)
+        self.mysteryTimer = np.where(mask, self.currentTime, self.mysteryTimer)
+        self.mysteryPlaySound |= mask
+
+    def enemy_count(self):
+        return self.alive.sum(axis=(1, 2))
+
+    def step(self, humanMove=None, humanShoot=None):
+        # humanMove holds -1/0/1 per game, humanShoot whether the human fires
+        if humanMove is None:
+            humanMove = np.zeros(self.size, int)
+        if humanShoot is None:
+            humanShoot = np.zeros(self.size, bool)
+        self.frames += 1
+        self.currentTime = int(self.frames * FRAME_TIME)
+        live = self.running
+        self.shoot(live, np.asarray(humanShoot, bool))
+        self.update_enemies(live)
+        self.update_ships(live, np.asarray(humanMove))
+        self.update_mystery(live)
+        self.update_bullets(live)
+        self.update_ai(live)
+        self.check_collisions(live)
+        self.create_new_ships(live)
+        self.make_enemies_shoot(live)
+        enemiesLeft = self.enemy_count() > 0
+        self.running = (live & ~self.gameOver & ~self.enemiesLanded
+                        & (enemiesLeft | (self.explosionEnd >= self.currentTime)))
+        return self.running
+
+    def shoot(self, live, humanShoot):
+        otherCanShoot = np.ones(self.size, bool)
+        if self.mode != "c":
+            otherCanShoot &= self.rightAliveColumn >= 5
+        diff = (self.shipX[:, OTHER] - self.mysteryX) * self.mysteryDirection
+        otherCanShoot |= (diff > 0) & (diff < 50)
+        otherCanShoot &= ~self.bulletActive[:, OTHER]
+        fire = np.stack([humanShoot & (self.humanLives > 0) & ~self.bulletActive[:, HUMAN],
+                         otherCanShoot & self.otherLife], axis=1) & live[:, None]
+        self.bulletActive |= fire
+        self.bulletX = np.where(fire, self.shipX + 23, self.bulletX)
+        self.bulletY = np.where(fire, SHIP_Y + 5, self.bulletY)
+
+    def update_enemies(self, live):
+        move = live & (self.currentTime - self.enemyTimer > self.moveTime)
+        descend = move & (self.moveNumber >= MARCH_MOVES)
+        march = move & ~descend
+        self.enemyDirection = np.where(descend, -self.enemyDirection, self.enemyDirection)
+        self.moveNumber = np.where(descend, 0, self.moveNumber + march)
+        self.originY += descend * ENEMY_MOVE_DOWN
+        self.originX += march * MARCH_STEP * self.enemyDirection
+        rowAlive = self.alive.any(axis=2)
+        lowestRow = ROWS - 1 - np.argmax(rowAlive[:, ::-1], axis=1)
+        lowest = np.where(rowAlive.any(axis=1), self.originY + self.rowY[lowestRow] + ENEMY_HEIGHT, 0)
+        self.bottom = np.where(descend, lowest, self.bottom)
+        self.enemyTimer += move * self.moveTime
+
+    def update_ships(self, live, humanMove):
+        x = self.shipX[:, HUMAN]
+        moving = live & self.shipAlive[:, HUMAN]
+        left = moving & (humanMove < 0) & (x > 10)
+        right = moving & (humanMove > 0) & (x < 740)
+        self.shipX[:, HUMAN] = x - 5 * left + 5 * right
+
+    def update_mystery(self, live):
+        passed = self.currentTime - self.mysteryTimer
+        moving = live & (passed > 25000)
+        offscreen = (self.mysteryX < 0) | (self.mysteryX > 800)
+        self.mysteryPlaySound &= ~(moving & offscreen)
+        right = moving & (self.mysteryX < 840) & (self.mysteryDirection == 1)
+        left = moving & (self.mysteryX > -100) & (self.mysteryDirection == -1)
+        self.mysteryX += 2 * right - 2 * left
+        turnLeft = live & (self.mysteryX > 830)
+        turnRight = live & (self.mysteryX < -90)
+        self.mysteryDirection = np.where(turnLeft, -1, np.where(turnRight, 1, self.mysteryDirection))
+        self.mysteryPlaySound |= turnLeft | turnRight
+        self.mysteryTimer = np.where(moving & (turnLeft | turnRight), self.currentTime, self.mysteryTimer)
+
+    def update_bullets(self, live):
+        self.bulletY -= 15 * (self.bulletActive & live[:, None])
+        self.bulletActive &= (self.bulletY >= 15) & (self.bulletY <= 600)
+        self.enemyBulletY += 5 * (self.enemyBulletActive & live[:, None])
+        self.enemyBulletActive &= (self.enemyBulletY >= 15) & (self.enemyBulletY <= 600)
+
+    def rightmost_enemy_x(self):
+        columnAlive = self.alive.any(axis=1)
+        right = self.columns - 1 - np.argmax(columnAlive[:, ::-1], axis=1)
+        return np.where(columnAlive.any(axis=1),
+                        np.maximum(self.columnX[right] + self.originX, 0), 0)
+
+    def update_ai(self, live):
+        # updateAI from spaceinvaders.py, one lane per game
+        x = self.shipX[:, OTHER]
+        rightEnemy = self.rightmost_enemy_x()
+        leftWall = 10 if self.mode == "c" else 410
+        threat = self.enemyBulletActive & (self.enemyBulletY >= 300)
+        diff = self.enemyBulletX - x[:, None]
+        moveLeft = ~(threat & (diff > -30) & (diff < -1)).any(axis=1)
+        hit = (threat & (diff >= -1) & (diff <= 50)).any(axis=1)
+        moveRight = ~(threat & (diff > 50) & (diff < 80)).any(axis=1)
+
+        self.aiDirection = np.where(x < 10, 1, np.where(x > 740, -1, self.aiDirection))
+        step = np.select(
+            [moveLeft & moveRight & hit,
+             (x > 10) & moveLeft & hit,
+             (x < 740) & moveRight & hit,
+             (x > rightEnemy) & moveLeft & (x > leftWall),
+             ((x < rightEnemy - 10) & moveRight) | ((x < leftWall) & moveRight)],
+            [self.aiDirection * 5, -5, 5, -5, 5], 0)
+        self.shipX[:, OTHER] = x + step * live
+
+    def enemy_hits(self, bulletX, bulletY, active):
+        # Maps each bullet to the first enemy it touches in formation order
+        # (the order groupcollide visits them), or -1 for a miss.
+        enemyX = self.columnX[None, None, :] + self.originX[:, None, None]
+        enemyY = self.rowY[None, None, :] + self.originY[:, None, None]
+        xHit = overlap(bulletX[:, :, None], BULLET_WIDTH, enemyX, ENEMY_WIDTH)
+        yHit = overlap(bulletY[:, :, None], BULLET_HEIGHT, enemyY, ENEMY_HEIGHT)
+        hits = (yHit[:, :, :, None] & xHit[:, :, None, :] & self.alive[:, None]
+                & active[:, :, None, None])
+        flat = hits.reshape(hits.shape[0], hits.shape[1], -1)
+        return np.where(flat.any(axis=2), np.argmax(flat, axis=2), -1)
+
+    def check_collisions(self, live):
+        n = self.size
+        games = np.arange(n)
+        t = self.currentTime
+        bulletActive = self.bulletActive & live[:, None]
+        enemyBulletActive = self.enemyBulletActive & live[:, None]
+
+        # Player bullets against enemy bullets
+        clash = (bulletActive[:, :, None] & enemyBulletActive[:, None, :]
+                 & overlap(self.bulletX[:, :, None], BULLET_WIDTH, self.enemyBulletX[:, None, :], BULLET_WIDTH)
+                 & overlap(self.bulletY[:, :, None], BULLET_HEIGHT, self.enemyBulletY[:, None, :], BULLET_HEIGHT))
+        bulletActive &= ~clash.any(axis=2)
+        enemyBulletActive &= ~clash.any(axis=1)
+
+        # Player bullets against the formation
+        target = self.enemy_hits(self.bulletX, self.bulletY, bulletActive)
+        for shooter in (HUMAN, OTHER):
+            hit = target[:, shooter] >= 0
+            row, column = np.divmod(np.maximum(target[:, shooter], 0), self.columns)
+            score = np.where(hit, ROW_SCORES[row], 0)
+            left = self.bulletX[:, shooter] < 400
+            self.playerScore += score * left
+            self.otherScore += score * ~left
+            self.kills[games, shooter, (column >= 5).astype(int)] += hit
+            self.alive[games[hit], row[hit], column[hit]] = False
+            bulletActive[:, shooter] &= ~hit
+        killed = (target >= 0).any(axis=1)
+        self.explosionEnd = np.where(killed, np.maximum(self.explosionEnd, t + 400), self.explosionEnd)
+        self.update_columns()
+
+        # Player bullets against the mystery ship
+        mysteryHit = (bulletActive
+                      & overlap(self.bulletX, BULLET_WIDTH, self.mysteryX[:, None], MYSTERY_WIDTH)
+                      & overlap(self.bulletY, BULLET_HEIGHT, MYSTERY_Y, MYSTERY_HEIGHT))
+        for shooter in (HUMAN, OTHER):
+            hit = mysteryHit[:, shooter]
+            score = np.where(hit, self.random.choice(MYSTERY_SCORES, n), 0)
+            left = self.bulletX[:, shooter] < 400
+            self.playerScore += score * left
+            self.otherScore += score * ~left
+        bulletActive &= ~mysteryHit
+        hit = mysteryHit.any(axis=1)
+        self.explosionEnd = np.where(hit, np.maximum(self.explosionEnd, t + 600), self.explosionEnd)
+        self.new_mystery(hit)
+
+        # Enemy bullets against the ships
+        shipHit = (self.shipAlive[:, :, None] & enemyBulletActive[:, None, :]
+                   & overlap(self.shipX[:, :, None], SHIP_WIDTH, self.enemyBulletX[:, None, :], BULLET_WIDTH)
+                   & overlap(SHIP_Y, SHIP_HEIGHT, self.enemyBulletY[:, None, :], BULLET_HEIGHT))
+        shipHit[:, OTHER] &= ~shipHit[:, HUMAN]
+        enemyBulletActive &= ~shipHit.any(axis=1)
+        shipHit = shipHit.any(axis=2)
+        self.humanLives -= shipHit[:, HUMAN] & (self.humanLives > 0)
+        self.otherLife &= ~shipHit[:, OTHER]
+        self.gameOver |= shipHit.any(axis=1) & (self.humanLives == 0) & ~self.otherLife
+        self.shipAlive &= ~shipHit
+        self.makeNew |= shipHit & np.stack([self.humanLives > 0, self.otherLife], axis=1)
+        anyHit = shipHit.any(axis=1)
+        self.shipTimer = np.where(anyHit, t, self.shipTimer)
+        self.explosionEnd = np.where(anyHit, np.maximum(self.explosionEnd, t + 900), self.explosionEnd)
+
+        self.bulletActive = bulletActive
+        self.enemyBulletActive = enemyBulletActive
+
+        # Formation reaching the ships
+        low = live & (self.bottom >= 540)
+        if low.any():
+            enemyX = self.columnX[None, None, :] + self.originX[:, None, None]
+            enemyY = self.rowY[None, :, None] + self.originY[:, None, None]
+            for ship in (HUMAN, OTHER):
+                touching = (self.alive & low[:, None, None] & self.shipAlive[:, ship, None, None]
+                            & overlap(self.shipX[:, ship, None, None], SHIP_WIDTH, enemyX, ENEMY_WIDTH)
+                            & overlap(SHIP_Y, SHIP_HEIGHT, enemyY, ENEMY_HEIGHT))
+                crashed = touching.any(axis=(1, 2))
+                self.alive &= ~touching
+                self.shipAlive[:, ship] &= ~crashed
+                if ship == HUMAN:
+                    self.humanLives[crashed] = 0
+                else:
+                    self.otherLife &= ~crashed
+            landed = low & (self.bottom >= 600)
+            killHuman = landed & (self.leftAliveColumn < 5)
+            killOther = landed & (self.rightAliveColumn >= 5)
+            self.shipAlive[:, HUMAN] &= ~killHuman
+            self.humanLives[killHuman] = 0
+            self.shipAlive[:, OTHER] &= ~killOther
+            self.otherLife &= ~killOther
+            self.enemiesLanded |= landed
+            self.gameOver |= low & ~self.shipAlive.any(axis=1)
+
+        self.update_columns()
+
+    def update_columns(self):
+        count = self.enemy_count()
+        self.moveTime = np.where(count == 1, 200, np.where(count <= 10, 400, self.moveTime))
+        columnAlive = self.alive.any(axis=1)
+        anyAlive = columnAlive.any(axis=1)
+        self.leftAliveColumn = np.where(anyAlive, np.argmax(columnAlive, axis=1), self.leftAliveColumn)
+        self.rightAliveColumn = np.where(anyAlive, self.columns - 1 - np.argmax(columnAlive[:, ::-1], axis=1), 0)
+
+    def create_new_ships(self, live):
+        respawn = live[:, None] & self.makeNew & (self.currentTime - self.shipTimer > 900)[:, None]
+        self.shipX = np.where(respawn, np.array([200, 600]), self.shipX)
+        self.shipAlive |= respawn
+        self.makeNew &= ~respawn
+        self.aiDirection = np.where(respawn[:, OTHER], -1, self.aiDirection)
+
+    def make_enemies_shoot(self, live):
+        fire = live & (self.currentTime - self.shootTimer > 700) & (self.enemy_count() > 0)
+        if not fire.any():
+            return
+        columnAlive = self.alive.any(axis=1)
+        # Uniform choice among the alive columns, then the bottom enemy of it
+        choice = (self.random.random(self.size) * columnAlive.sum(axis=1)).astype(int)
+        column = np.argmax(np.cumsum(columnAlive, axis=1) > choice[:, None], axis=1)
+        inColumn = self.alive[np.arange(self.size), :, column]
+        row = ROWS - 1 - np.argmax(inColumn[:, ::-1], axis=1)
+        slot = np.argmin(self.enemyBulletActive, axis=1)
+        fire &= ~self.enemyBulletActive[np.arange(self.size), slot]
+        games = np.nonzero(fire)[0]
+        self.enemyBulletActive[games, slot[games]] = True
+        self.enemyBulletX[games, slot[games]] = self.columnX[column[games]] + self.originX[games] + 14
+        self.enemyBulletY[games, slot[games]] = self.rowY[row[games]] + self.originY[games] + 20
+        self.shootTimer = np.where(fire, self.currentTime, self.shootTimer)
+
+    def results(self):
+        # Same tuples as SpaceInvaders.results, one row per game
+        human = np.stack([self.playerScore, self.humanLives > 0,
+                          self.kills[:, HUMAN, 0], self.kills[:, HUMAN, 1]], axis=1)
+        other = np.stack([self.otherScore, self.otherLife,
+                          self.kills[:, OTHER, 0], self.kills[:, OTHER, 1]], axis=1)
+        return human, other
+
+    def run(self, maxFrames=MAX_HEADLESS_FRAMES):
+        while self.frames < maxFrames and self.running.any():
+            self.step()
+        return self.results()
+
+
+if __name__ == '__main__':
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    batch = BatchInvaders(size, parse_mode(sys.argv), seed=0)
+    start = ti.time()
+    human, other = batch.run()
+    elapsed = ti.time() - start
+    steps = batch.frames * size
+    print("Human mean score: {:.1f}, AI mean score: {:.1f}".format(human[:, 0].mean(), other[:, 0].mean()))
+    print("{} game steps in {:.2f}s ({:.0f} game steps/s)".format(steps, elapsed, steps / elapsed))
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+
+# Space Invaders - 2-Playered
+# Benchmark suite. Runs the full game (simulation and dirty-rect rendering)
+# under SDL's dummy video and audio drivers through scripted scenarios and
+# reports steps/s, frame time percentiles and peak Python allocations.
+#
+#   python3 benchmarks.py --save            # record benchmark_baseline.json
+#   python3 benchmarks.py                   # compare against it
+#   python3 benchmarks.py bullet_storm --frames 2000
+#
+# Exits with status 1 when a scenario is slower or allocates more than the
+# baseline by more than --tolerance. Timings only compare on the machine that
+# recorded them, so the baseline is kept out of git.
+
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import json
+import sys
+import tracemalloc
+from collections import defaultdict
+from time import perf_counter
+
+import spaceinvaders
+from profiler import percentile
+from pygame import K_LEFT, K_RIGHT, display
+from spaceinvaders import FRAME_TIME, EnemiesGroup, Enemy, SpaceInvaders, ENEMY_DEFAULT_POSITION
+
+BASELINE_PATH = os.path.join(spaceinvaders.BASE_PATH, 'benchmark_baseline.json')
+SEED = 1
+FRAMES = 600
+REPEATS = 3
+TOLERANCE = 0.10
+
+STORM_BULLETS = 60
+STORM_FLOOR = 500
+BURST_INTERVAL = 30  # frames between mass kills
+BIG_COLUMNS = 20  # the real formation has 10
+
+
+def sweep(game, frame, keys):
+    # Scripted human: sweeps left and right and keeps firing
+    keys[K_LEFT] = frame % 240 < 120
+    keys[K_RIGHT] = not keys[K_LEFT]
+    return True
+
+
+def human_bullet(game, rect):
+    game.bulletPool.acquire(rect.centerx - 2, rect.centery, -1, 15, 'laser', "human",
+                            game.bullets, game.allSprites)
+
+
+def full_wave(game, frame, keys):
+    return sweep(game, frame, keys)
+
+
+def bullet_storm(game, frame, keys):
+    # Keeps STORM_BULLETS enemy bullets in the air; they are taken out just
+    # above the ships so the game does not end
+    for bullet in game.enemyBullets:
+        if bullet.rect.y > STORM_FLOOR:
+            bullet.kill()
+    while len(game.enemyBullets) < STORM_BULLETS and game.enemies:
+        enemy = game.enemies.random_bottom()
+        game.bulletPool.acquire(enemy.rect.x + 14, enemy.rect.y + 20, 1, 5, 'enemylaser', "enemy",
+                                game.enemyBullets, game.allSprites)
+    return sweep(game, frame, keys)
+
+
+def kill_burst(game, frame, keys):
+    # Every BURST_INTERVAL frames a bullet is put on every enemy of the lowest
+    # two rows, so dozens of kills, scores and explosions land in one step
+    if not game.enemies:
+        game.make_enemies()
+    elif frame % BURST_INTERVAL == 0:
+        for enemy in list(game.enemies):
+            if enemy.row >= game.enemies.bottomRow - 1:
+                human_bullet(game, enemy.rect)
+    return sweep(game, frame, keys)
+
+
+def mystery_spawns(game, frame, keys):
+    # The mystery ship flies all the time and is shot down every 20 frames
+    for mystery in game.mysteryGroup:
+        if not mystery.visible:
+            mystery.timer = game.currentTime - mystery.moveTime - 1
+        elif frame % 20 == 0 and 0 <= mystery.rect.x <= 720:
+            human_bullet(game, mystery.rect)
+    return sweep(game, frame, keys)
+
+
+def big_formation(game, frame, keys):
+    if frame == 0:
+        # A row also picks the art, explosion and score of an enemy (row 5 is
+        # the mystery ship), so the formation can only grow sideways; its right
+        # half runs past the edge of the screen
+        enemies = EnemiesGroup(BIG_COLUMNS, 5, ENEMY_DEFAULT_POSITION, game.currentTime, game.random)
+        for row in range(5):
+            for column in range(BIG_COLUMNS):
+                enemies.add(Enemy(row, column))
+        game.enemies = enemies
+    return sweep(game, frame, keys)
+
+
+# name, mode, script, shields
+SCENARIOS = [('full_wave', 'c', full_wave, False),
+             ('bullet_storm', 'c', bullet_storm, False),
+             ('kill_burst', 'c', kill_burst, False),
+             ('mystery_spawns', 'd', mystery_spawns, False),
+             ('big_formation', 'c', big_formation, False),
+             ('shield_storm', 'c', bullet_storm, True)]
+
+
+def play(mode, script, shields, frames, traced=False):
+    # Returns the wall time of every frame in ms and, if traced, the peak
+    # memory allocated by the frames (building the game does not count)
+    game = SpaceInvaders(mode, seed=SEED, shields=shields)
+    game.start_game()
+    if traced:
+        tracemalloc.start()
+    keys = defaultdict(bool)
+    times = []
+    for frame in range(frames):
+        if not game.is_running():
+            break
+        start = perf_counter()
+        humanShoot = script(game, frame, keys)
+        game.step(int((frame + 1) * FRAME_TIME), keys, humanShoot)
+        display.update(game.render())
+        times.append((perf_counter() - start) * 1000)
+    peak = None
+    if traced:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return times, peak
+
+
+def run(mode, script, shields, frames, repeats):
+    best = None
+    for _ in range(repeats):
+        times, _ = play(mode, script, shields, frames)
+        if best is None or sum(times) < sum(best):
+            best = times
+    _, peak = play(mode, script, shields, frames, traced=True)
+    times = sorted(best)
+    return {'frames': len(times),
+            'steps_per_s': round(len(times) / (sum(times) / 1000.0), 1),
+            'p50_ms': round(percentile(times, 0.5), 3),
+            'p95_ms': round(percentile(times, 0.95), 3),
+            'p99_ms': round(percentile(times, 0.99), 3),
+            'max_ms': round(times[-1], 3),
+            'peak_kib': round(peak / 1024.0, 1)}
+
+
+def regressions(result, baseline, tolerance):
+    # (metric, baseline, result) for every metric worse than tolerance allows
+    worse = []
+    if result['steps_per_s'] < baseline['steps_per_s'] * (1 - tolerance):
+        worse.append(('steps_per_s', baseline['steps_per_s'], result['steps_per_s']))
+    for metric in ('p95_ms', 'peak_kib'):
+        if result[metric] > baseline[metric] * (1 + tolerance):
+            worse.append((metric, baseline[metric], result[metric]))
+    return worse
+
+
+def main(argv=None):
+    names = [name for name, _, _, _ in SCENARIOS]
+    parser = argparse.ArgumentParser(description="Benchmark the game loop under the dummy SDL drivers.")
+    parser.add_argument('scenarios', nargs='*', default=names, help=", ".join(names))
+    parser.add_argument('--frames', type=int, default=FRAMES)
+    parser.add_argument('--repeats', type=int, default=REPEATS, help="timed runs; the fastest is kept")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save', action='store_true', help="write the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+    for name in args.scenarios:
+        if name not in names:
+            parser.error("unknown scenario {}".format(name))
+
+    baseline = {}
+    if not args.save and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {}
+    failed = False
+    print("{:<15} {:>6} {:>9} {:>7} {:>7} {:>7} {:>7} {:>9}".format(
+        'scenario', 'frames', 'steps/s', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms', 'peak KiB'))
+    for name, mode, script, shields in SCENARIOS:
+        if name not in args.scenarios:
+            continue
+        result = results[name] = run(mode, script, shields, args.frames, args.repeats)
+        print("{:<15} {frames:>6} {steps_per_s:>9.0f} {p50_ms:>7.2f} {p95_ms:>7.2f} {p99_ms:>7.2f} "
+              "{max_ms:>7.2f} {peak_kib:>9.1f}".format(name, **result))
+        if name in baseline:
+            for metric, before, after in regressions(result, baseline[name], args.tolerance):
+                print("  REGRESSION {}: {} -> {}".format(metric, before, after))
+                failed = True
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print("Saved baseline to {}".format(args.baseline))
+    elif not baseline:
+        print("No baseline at {}; run with --save to record one".format(args.baseline))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+# Space Invaders - 2-Playered
+# Checks the game's shortcuts against the plain way of doing the same thing,
+# over seeded games with a scripted human:
+#   collide    EnemiesGroup.collide against sprite.spritecollide over the
+#              whole formation, as sprite.groupcollide does it
+#   formation  the column, row and bounds bookkeeping of EnemiesGroup against
+#              a full scan of the enemies, after every step
+#   render     the dirty-rect screen against a full redraw, after every frame
+#              (under SDL's dummy video driver)
+#
+#   python3 checks.py
+#   python3 checks.py --modes d --seeds 50 --render-frames 0
+#
+# Exits with status 1 on any mismatch.
+
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import random
+import sys
+from collections import defaultdict
+
+from pygame import K_LEFT, K_RIGHT, Surface, draw, image, sprite
+from spaceinvaders import (FONT, FRAME_TIME, GREEN, RED, WHITE, EnemiesGroup, SpaceInvaders, Text,
+                           MAX_HEADLESS_FRAMES)
+
+SEEDS = 10
+RENDER_FRAMES = 600
+
+
+def wander(game, keys):
+    # Scripted human: now and then changes direction, fires a fifth of the time
+    rng = random.Random(game.currentTime * 7 + game.player.rect.x)
+    if rng.random() < 0.05:
+        move = rng.choice([-1, 0, 1])
+        keys[K_LEFT] = move < 0
+        keys[K_RIGHT] = move > 0
+    return rng.random() < 0.2
+
+
+class Checks(object):
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.mismatches = defaultdict(int)
+
+    def check(self, name, ok, detail):
+        self.counts[name] += 1
+        if not ok:
+            self.mismatches[name] += 1
+            if self.mismatches[name] <= 5:
+                print("  {} mismatch: {}".format(name, detail))
+
+    def collide(self, enemies, bullets, collide):
+        # sprite.groupcollide(enemies, bullets, True, True) visits the enemies
+        # in the order they were added and kills the bullets as it goes; the
+        # bullets are taken out of a copy here so nothing is killed early
+        remaining = sprite.Group(bullets.sprites())
+        expected = {}
+        for enemy in enemies.sprites():
+            hit = sprite.spritecollide(enemy, remaining, False)
+            if hit:
+                expected[enemy] = hit
+                remaining.remove(*hit)
+        remaining.empty()
+        collided = collide(enemies, bullets)
+        self.check('collide', list(collided.items()) == list(expected.items()),
+                   "{} hits, expected {}".format(len(collided), len(expected)))
+        return collided
+
+    def formation(self, enemies, where):
+        columnCounts = [0] * enemies.columns
+        columnBottom = [-1] * enemies.columns
+        rowCounts = [0] * enemies.rows
+        for enemy in enemies:
+            self.check('formation', enemies.enemies[enemy.row][enemy.column] is enemy,
+                       "{} is not in its cell {}".format(where, (enemy.row, enemy.column)))
+            columnCounts[enemy.column] += 1
+            columnBottom[enemy.column] = max(columnBottom[enemy.column], enemy.row)
+            rowCounts[enemy.row] += 1
+        cells = sum(enemy is not None for row in enemies.enemies for enemy in row)
+        self.check('formation', cells == len(enemies),
+                   "{} {} cells taken by {} enemies".format(where, cells, len(enemies)))
+        self.check('formation', enemies.columnCounts == columnCounts, "{} columnCounts".format(where))
+        self.check('formation', enemies.columnBottom == columnBottom, "{} columnBottom".format(where))
+        self.check('formation', enemies.rowCounts == rowCounts, "{} rowCounts".format(where))
+        alive = [column for column in range(enemies.columns) if columnCounts[column]]
+        self.check('formation', enemies._aliveColumns == alive, "{} _aliveColumns".format(where))
+        if not enemies:
+            self.check('formation', enemies.bounds() is None, "{} bounds of no enemies".format(where))
+            return
+        rows = [row for row in range(enemies.rows) if rowCounts[row]]
+        self.check('formation', (enemies.topRow, enemies.bottomRow) == (rows[0], rows[-1]),
+                   "{} topRow, bottomRow".format(where))
+        self.check('formation', (enemies.leftAliveColumn, enemies.rightAliveColumn) == (alive[0], alive[-1]),
+                   "{} leftAliveColumn, rightAliveColumn".format(where))
+        rects = [enemy.rect for enemy in enemies]
+        self.check('formation', enemies.bounds() == rects[0].unionall(rects[1:]),
+                   "{} bounds {}".format(where, enemies.bounds()))
+
+    def render(self, game, where):
+        self.check('render', image.tobytes(game.screen, 'RGB') == image.tobytes(redraw(game), 'RGB'),
+                   where)
+
+    def summary(self):
+        for name in ('collide', 'formation', 'render'):
+            print("{:<10} {:>9} checks {:>5} mismatches".format(name, self.counts[name], self.mismatches[name]))
+        return sum(self.mismatches.values())
+
+
+def redraw(game):
+    # The whole game screen drawn from scratch, the way the original did
+    surface = Surface(game.screen.get_size())
+    surface.blit(game.background, (0, 0))
+    for text in (game.scoreText, Text(FONT, 20, str(game.player_score), GREEN, 85, 5),
+                 game.scoreTextO, Text(FONT, 20, str(game.other_score), GREEN, 485, 5),
+                 game.livesTextPlayer, game.livesTextOther):
+        text.draw(surface)
+    if not game.lifePlayer1.alive():
+        draw.line(surface, RED, (238, 15), (310, 15), 3)
+    if not game.lifeOther.alive():
+        draw.line(surface, RED, (638, 15), (710, 15), 3)
+    draw.line(surface, WHITE, (400, 0), (400, 600), 1)
+    for shield in game.shields:
+        pixels = {0: bytes(4), 1: bytes(GREEN) + b'\xff'}
+        bitmap = b''.join(pixels[pixel] for pixel in shield.bitmap)
+        surface.blit(image.frombuffer(bitmap, shield.rect.size, 'RGBA'), shield.rect)
+    for group in (game.livesGroup, game.enemies, game.allSprites, game.explosionsGroup):
+        for sprite_ in group:
+            sprite_.draw(surface)
+    return surface
+
+
+def play(checks, mode, seed, shields, renderFrames):
+    # One seeded game, as play_headless runs it; the first renderFrames frames
+    # are drawn and compared with a full redraw
+    where = "{} seed {}{}".format(mode, seed, " shields" if shields else "")
+    game = SpaceInvaders(mode, headless=renderFrames == 0, seed=seed, shields=shields)
+    game.start_game()
+    keys = defaultdict(bool)
+    frames = 0
+    while frames < MAX_HEADLESS_FRAMES and game.is_running():
+        humanShoot = wander(game, keys)
+        frames += 1
+        game.step(int(frames * FRAME_TIME), keys, humanShoot)
+        checks.formation(game.enemies, "{} frame {}".format(where, frames))
+        if frames <= renderFrames and game.is_running():
+            game.render()
+            checks.render(game, "{} frame {}".format(where, frames))
+    return frames
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the game's shortcuts against the plain way.")
+    parser.add_argument('--modes', nargs='+', default=['c', 'd', 'p'], choices=['c', 'd', 'p'])
+    parser.add_argument('--seeds', type=int, default=SEEDS, help="games per mode, with and without shields")
+    parser.add_argument('--render-frames', type=int, default=RENDER_FRAMES,
+                        help="frames of the first game of each kind to compare with a full redraw")
+    args = parser.parse_args(argv)
+
+    checks = Checks()
+    collide = EnemiesGroup.collide
+    EnemiesGroup.collide = lambda enemies, bullets: checks.collide(enemies, bullets, collide)
+    try:
+        for mode in args.modes:
+            for shields in (False, True):
+                for seed in range(args.seeds):
+                    play(checks, mode, seed, shields, args.render_frames if seed == 0 else 0)
+    finally:
+        EnemiesGroup.collide = collide
+    return 1 if checks.summary() else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+
+# Space Invaders - 2-Playered
+# Aggregates the sessions logged by makeExit in game_logs/*.txt.
+#
+#   python3 loganalytics.py
+#   python3 loganalytics.py --modes c d --since 11/27/2019 --until 12/01/2019
+#
+# Each log is streamed line by line from the offset reached on the previous
+# run, so only appended bytes are ever read. Parsed sessions are appended to a
+# fixed-width binary index (game_logs/index/<log>.idx) and folded into per-mode
+# totals kept next to it (<log>.json). Queries without a date range are
+# answered from the totals alone; date ranges bisect the index, which is in
+# append order and therefore sorted by date.
+
+import argparse
+import calendar
+import json
+import os
+import struct
+import sys
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+LOG_PATHS = [BASE_PATH + '/game_logs/main_logs.txt', BASE_PATH + '/game_logs/other_logs.txt']
+INDEX_PATH = BASE_PATH + '/game_logs/index/'
+DATE_FORMAT = "%m/%d/%Y %H:%M:%S"  # as written by spaceinvaders.py
+
+# time (seconds, local clock), mode, duration, then Score, Survived, Enemies
+# Killed on Left and Enemies Killed on Right for the human and the AI, and the
+# byte offset of the session in its log
+INDEX_RECORD = struct.Struct('<Ic I iBii iBii Q')
+INDEX_CHUNK = 4096  # records per read when scanning the index
+
+MODES = {'Game against: cooperative player': 'c',
+         'Game against: uncooperative player': 'd',
+         'Game: practice round': 'p'}
+
+
+def parse_date(text):
+    # Same as strptime with DATE_FORMAT, which is the slowest part of a parse
+    date, _, clock = text.partition(' ')
+    month, day, year = date.split('/')
+    hour, minute, second = clock.split(':')
+    return calendar.timegm((int(year), int(month), int(day), int(hour), int(minute), int(second)))
+
+
+def parse_result(line):
+    # "Human: (520, False, 46, 0)" -> (520, 1, 46, 0)
+    values = line[line.index('(') + 1:line.rindex(')')].split(',')
+    score, survived, left, right = (value.strip() for value in values)
+    return int(score), int(survived == 'True'), int(left), int(right)
+
+
+def new_stats():
+    return {'matches': 0, 'durations': {}, 'human': [0, 0, 0, 0], 'ai': [0, 0, 0, 0],
+            'policy': [0, 0, 0.0]}
+
+
+class Totals(object):
+    # Per-mode sums, enough to report means and the duration distribution
+    # without keeping the sessions themselves. tournament.py reports its
+    # matches with it too, along with how the AI policy kept to its budget.
+    def __init__(self, modes=None, aiBudget=None):
+        self.modes = modes or {}
+        self.aiBudget = aiBudget
+
+    def add(self, mode, duration, human, other, policy=None):
+        # policy is the AI policy's (calls, calls over budget, mean ms), if known
+        stats = self.modes.setdefault(mode, new_stats())
+        stats['matches'] += 1
+        durations = stats['durations']
+        # Whole seconds, so the histogram stays small
+        duration = str(int(duration))
+        durations[duration] = durations.get(duration, 0) + 1
+        for i in range(4):
+            stats['human'][i] += human[i]
+            stats['ai'][i] += other[i]
+        if policy is not None:
+            calls, overruns, mean = policy
+            # Totals saved before the policy was tracked have none
+            totals = stats.setdefault('policy', [0, 0, 0.0])
+            totals[0] += calls
+            totals[1] += overruns
+            totals[2] += calls * mean
+
+    def merge(self, other):
+        for mode, stats in other.modes.items():
+            mine = self.modes.setdefault(mode, new_stats())
+            mine['matches'] += stats['matches']
+            for duration, count in stats['durations'].items():
+                mine['durations'][duration] = mine['durations'].get(duration, 0) + count
+            for player in ('human', 'ai', 'policy'):
+                if player in stats:
+                    mine[player] = [a + b for a, b in zip(mine.get(player, [0, 0, 0.0]), stats[player])]
+
+    def write(self, out, modes=None):
+        for mode in sorted(self.modes):
+            if modes is not None and mode not in modes:
+                continue
+            stats = self.modes[mode]
+            n = float(stats['matches'])
+            durations = sorted((int(duration), count) for duration, count in stats['durations'].items())
+            total = sum(duration * count for duration, count in durations)
+            out.write("Mode {}: {} matches\n".format(mode, stats['matches']))
+            out.write("Duration (seconds): mean {:.1f}, median {}, p90 {}, min {}, max {}\n".format(
+                total / n, percentile(durations, 0.5), percentile(durations, 0.9),
+                durations[0][0], durations[-1][0]))
+            out.write("(Mean Score, Survival Rate, Mean Killed on Left, Mean Killed on Right)\n")
+            for player, label in (('human', 'Human'), ('ai', 'AI')):
+                score, survived, left, right = (value / n for value in stats[player])
+                out.write("{}: ({:.1f}, {:.2f}, {:.1f}, {:.1f})\n".format(label, score, survived, left, right))
+            calls, overruns, time = stats.get('policy', (0, 0, 0.0))
+            if calls:
+                out.write("AI policy: {:.3f} ms per call, {} of {} calls over the {} ms budget\n".format(
+                    time / calls, overruns, calls, self.aiBudget))
+            out.write("\n")
+
+
+def percentile(durations, fraction):
+    # durations is a sorted list of (duration, count)
+    rank = fraction * (sum(count for _, count in durations) - 1)
+    seen = 0
+    for duration, count in durations:
+        seen += count
+        if seen > rank:
+            return duration
+    return durations[-1][0]
+
+
+class LogIndex(object):
+    def __init__(self, logPath, indexPath=INDEX_PATH):
+        name = os.path.splitext(os.path.basename(logPath))[0]
+        self.logPath = logPath
+        self.indexFile = indexPath + name + '.idx'
+        self.stateFile = indexPath + name + '.json'
+        if not os.path.isdir(indexPath):
+            os.makedirs(indexPath)
+        self.load()
+
+    def load(self):
+        self.offset = 0
+        self.records = 0
+        self.skipped = 0
+        self.totals = Totals()
+        if os.path.exists(self.stateFile):
+            with open(self.stateFile) as f:
+                state = json.load(f)
+            self.offset = state['offset']
+            self.records = state['records']
+            self.skipped = state['skipped']
+            self.totals = Totals(state['modes'])
+        if self.offset > os.path.getsize(self.logPath):
+            # The log was truncated or replaced; start again
+            self.offset = self.records = self.skipped = 0
+            self.totals = Totals()
+        # Drop index records written after the last saved state
+        with open(self.indexFile, 'ab') as f:
+            f.truncate(self.records * INDEX_RECORD.size)
+
+    def save(self):
+        state = {'offset': self.offset, 'records': self.records, 'skipped': self.skipped,
+                 'modes': self.totals.modes}
+        with open(self.stateFile + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(self.stateFile + '.tmp', self.stateFile)
+
+    def update(self):
+        # Parses the sessions appended since the last update; returns how many
+        # were added. A session still being written is left for the next run.
+        added = 0
+        session = None
+        with open(self.logPath, 'rb') as log, open(self.indexFile, 'ab') as index:
+            log.seek(self.offset)
+            pos = self.offset
+            committed = pos
+            for raw in log:
+                if not raw.endswith(b'\n'):
+                    break  # partly written line
+                start = pos
+                pos += len(raw)
+                line = raw.decode().strip()
+                if line.startswith('Date/Time:'):
+                    if session is not None:
+                        # Game was closed before makeExit wrote its results
+                        self.skipped += 1
+                    session = {'offset': start, 'time': parse_date(line[len('Date/Time:'):].strip())}
+                    committed = start
+                elif session is None:
+                    committed = pos
+                elif line in MODES:
+                    session['mode'] = MODES[line]
+                elif line.startswith('Duration (seconds):'):
+                    session['duration'] = int(line.split(':')[1])
+                elif line.startswith('Human:'):
+                    session['human'] = parse_result(line)
+                elif line.startswith('AI:'):
+                    if len(session) == 5:
+                        human = session['human']
+                        other = parse_result(line)
+                        index.write(INDEX_RECORD.pack(session['time'], session['mode'].encode(),
+                                                      session['duration'], *(human + other + (session['offset'],))))
+                        self.totals.add(session['mode'], session['duration'], human, other)
+                        added += 1
+                    else:
+                        self.skipped += 1
+                    session = None
+                    committed = pos
+            if session is None:
+                committed = pos
+        self.offset = committed
+        self.records += added
+        self.save()
+        return added
+
+    def scan(self, since=None, until=None):
+        # Yields index records with since <= time < until
+        with open(self.indexFile, 'rb') as f:
+            lo, hi = 0, self.records
+            if since is not None:
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    f.seek(mid * INDEX_RECORD.size)
+                    if INDEX_RECORD.unpack(f.read(INDEX_RECORD.size))[0] < since:
+                        lo = mid + 1
+                    else:
+                        hi = mid
+            f.seek(lo * INDEX_RECORD.size)
+            remaining = self.records - lo
+            while remaining:
+                chunk = f.read(min(remaining, INDEX_CHUNK) * INDEX_RECORD.size)
+                remaining -= len(chunk) // INDEX_RECORD.size
+                for record in INDEX_RECORD.iter_unpack(chunk):
+                    if until is not None and record[0] >= until:
+                        return
+                    yield record
+
+    def query(self, since=None, until=None):
+        if since is None and until is None:
+            return self.totals
+        totals = Totals()
+        for record in self.scan(since, until):
+            totals.add(record[1].decode(), record[2], record[3:7], record[7:11])
+        return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarise the sessions in game_logs.")
+    parser.add_argument('--logs', nargs='+', default=LOG_PATHS)
+    parser.add_argument('--modes', nargs='+', default=['c', 'd', 'p'], choices=['c', 'd', 'p'])
+    parser.add_argument('--since', default=None, help="MM/DD/YYYY, inclusive")
+    parser.add_argument('--until', default=None, help="MM/DD/YYYY, exclusive")
+    args = parser.parse_args(argv)
+    since = parse_date(args.since + " 00:00:00") if args.since else None
+    until = parse_date(args.until + " 00:00:00") if args.until else None
+
+    totals = Totals()
+    for path in args.logs:
+        index = LogIndex(path)
+        added = index.update()
+        sys.stderr.write("{}: {} sessions ({} new, {} incomplete)\n".format(
+            os.path.basename(path), index.records, added, index.skipped))
+        totals.merge(index.query(since, until))
+    totals.write(sys.stdout, args.modes)
+
+
+if __name__ == '__main__':
+    main()
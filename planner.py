@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+# Space Invaders - 2-Playered
+# Look-ahead AI policy. Every step, RolloutPlanner takes a snapshot of the game
+# and plays it forward HORIZON steps per rollout: the AI holds one candidate
+# (move, fire) for HOLD steps and plays updateAI after that, while the human
+# stays idle. Each rollout reseeds the game's random generator, so enemy fire
+# is sampled rather than read off the game's seed. The candidate with the best
+# mean outcome is played. Rollouts run in this process and in a pool with a
+# worker per other core until the step's AI budget runs out, so the rollouts
+# per step grow with the number of cores. Consecutive steps start from nearly
+# the same state, so the outcomes of earlier steps still count, at DECAY per step.
+#
+#   python3 spaceinvaders.py c --planner
+#   python3 tournament.py --modes c d --ai planner:RolloutPlanner --ai-budget 12 --workers 1
+#
+# Rollouts are cut off by wall time, so unlike updateAI the planner does not
+# play a seed the same way twice.
+
+import random
+from collections import defaultdict
+from multiprocessing import TimeoutError, cpu_count, current_process, get_context
+from time import perf_counter
+
+from spaceinvaders import FRAME_TIME, AIAction, SpaceInvaders, updateAI
+
+HORIZON = 30  # steps, half a second
+HOLD = 10
+DECAY = 0.5
+# A rollout takes a couple of ms, so the planner wants more than AI_BUDGET_MS;
+# this still leaves time to step and draw a 60 Hz frame
+PLANNER_BUDGET_MS = 12.0
+# On a tie the first of these is played, so firing wins over holding fire
+CANDIDATES = [(move, fire) for move in (-1, 0, 1) for fire in (True, False)]
+# Losing its only life outweighs any score the AI could make in a rollout
+DEATH_PENALTY = 1000
+# Parts of the budget by which rollouts have to be done and results collected;
+# the rest is left for the snapshot and for handing out the work
+ROLLOUT_SHARE = 0.75
+COLLECT_SHARE = 0.9
+SHIP_LEFT, SHIP_RIGHT = 10, 740
+
+
+class Script(object):
+    # The AI of a rollout: the candidate for the first hold steps, then updateAI
+    def __init__(self, move, fire, hold=HOLD):
+        self.move = move
+        self.fire = fire
+        self.hold = hold
+
+    def __call__(self, view):
+        if self.hold <= 0:
+            return updateAI(view)
+        self.hold -= 1
+        move = self.move
+        if (move < 0 and view.x <= SHIP_LEFT) or (move > 0 and view.x >= SHIP_RIGHT):
+            move = 0
+        return AIAction(move, move or view.direction, self.fire)
+
+
+def outcome(game):
+    # What the AI plays for: the team's score when cooperative, its own otherwise
+    score = game.other_score
+    if game.mode == "c":
+        score += game.player_score
+    if not game.lifeOther.alive():
+        score -= DEATH_PENALTY
+    return score
+
+
+def rollout(game, data, move, fire, seed, horizon=HORIZON):
+    game.restore(data)
+    game.random.seed(seed)
+    game.aiPolicy = Script(move, fire)
+    keys = defaultdict(bool)
+    before = outcome(game)
+    start = game.currentTime
+    for step in range(1, horizon + 1):
+        if not game.is_running():
+            break
+        game.step(int(start + step * FRAME_TIME), keys)
+    return outcome(game) - before
+
+
+ROLLOUT_GAME = None
+
+
+def run_rollouts(task):
+    # Rollouts of each candidate in turn, starting with candidate first, for
+    # as long as another one fits before the deadline (a perf_counter time,
+    # which is the same in every process). Returns [total, count] per candidate.
+    data, first, seed, deadline = task
+    global ROLLOUT_GAME
+    if ROLLOUT_GAME is None:
+        ROLLOUT_GAME = SpaceInvaders(headless=True)
+    rng = random.Random(seed)
+    totals = [[0, 0] for _ in CANDIDATES]
+    candidate = first % len(CANDIDATES)
+    longest = 0.0
+    now = perf_counter()
+    while now + longest < deadline:
+        move, fire = CANDIDATES[candidate]
+        totals[candidate][0] += rollout(ROLLOUT_GAME, data, move, fire, rng.getrandbits(32))
+        totals[candidate][1] += 1
+        candidate = (candidate + 1) % len(CANDIDATES)
+        last, now = now, perf_counter()
+        longest = max(longest, now - last)
+    return totals
+
+
+POOL = None
+
+
+def get_rollout_pool(workers):
+    # One pool per process, made on first use. None without workers, or in a
+    # daemon process (e.g. a tournament worker), which cannot have children.
+    # Workers are spawned rather than forked, so they do not inherit the
+    # window, the mixer or the telemetry thread.
+    global POOL
+    if POOL is None:
+        POOL = False
+        if workers > 0 and not current_process().daemon:
+            POOL = get_context('spawn').Pool(workers)
+    return POOL or None
+
+
+class RolloutPlanner(object):
+    def __init__(self, workers=None, seed=None):
+        if workers is None:
+            workers = cpu_count() - 1
+        self.workers = workers
+        self.pool = get_rollout_pool(workers)
+        self.random = random.Random(seed)
+        # Decayed [total, count] of the outcomes of each candidate
+        self.totals = [[0.0, 0.0] for _ in CANDIDATES]
+        # Where the next step's rollouts start, so every candidate gets its
+        # turn even when only a few rollouts fit in a step
+        self.nextCandidate = 0
+        # For the summary: steps planned, rollouts run and worker results
+        # that came in too late to count
+        self.calls = 0
+        self.rollouts = 0
+        self.late = 0
+
+    def __call__(self, view):
+        start = perf_counter()
+        default = updateAI(view)
+        if not view.alive:
+            self.totals = [[0.0, 0.0] for _ in CANDIDATES]
+            return default
+        budget = view.budget / 1000.0
+        data = view.snapshot()
+        deadline = start + budget * ROLLOUT_SHARE
+        processes = 1 + (self.workers if self.pool else 0)
+        firsts = [self.nextCandidate + n * len(CANDIDATES) // processes for n in range(processes)]
+        pending = [self.pool.apply_async(run_rollouts,
+                                         ((data, first, self.random.getrandbits(32), deadline),))
+                   for first in firsts[1:]]
+        parts = [run_rollouts((data, firsts[0], self.random.getrandbits(32), deadline))]
+        for result in pending:
+            try:
+                parts.append(result.get(max(0.0, start + budget * COLLECT_SHARE - perf_counter())))
+            except TimeoutError:
+                self.late += 1
+        for total in self.totals:
+            total[0] *= DECAY
+            total[1] *= DECAY
+        for part in parts:
+            for total, (score, count) in zip(self.totals, part):
+                total[0] += score
+                total[1] += count
+                self.rollouts += count
+        self.nextCandidate = (self.nextCandidate + sum(count for _, count in parts[0])) % len(CANDIDATES)
+        self.calls += 1
+        best = None
+        for (move, fire), (score, count) in zip(CANDIDATES, self.totals):
+            if count:
+                # Ties go to the move updateAI would make
+                key = (score / float(count), move == default.move)
+                if best is None or key > best[0]:
+                    best = (key, move, fire)
+        if best is None:
+            # Not even one rollout has fit in the budget yet
+            return default
+        _, move, fire = best
+        return AIAction(move, move or default.direction, fire)
+
+    def summary(self):
+        return "Planner: {:.1f} rollouts per step on {} processes, {} late worker results".format(
+            self.rollouts / float(max(self.calls, 1)), self.workers + 1, self.late)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+# Space Invaders - 2-Playered
+# Per-phase frame profiler. The game calls mark(phase) after each phase of a
+# frame, which costs one perf_counter call; end() closes the frame. Every phase
+# keeps the last WINDOW frames for rolling percentiles (shown by the F3
+# overlay) and a log2 histogram of the whole session, dumped at exit.
+
+from array import array
+from time import perf_counter
+
+# In the order a frame runs them
+PHASES = ('input', 'shoot', 'enemies', 'sprites', 'ai', 'explosions',
+          'collisions', 'enemy_fire', 'render', 'display', 'wait')
+# Not part of the work done for a frame; this is the game sleeping until the next one
+IDLE_PHASES = ('wait',)
+WINDOW = 600  # frames, 10 seconds at 60 Hz
+HISTOGRAM_BUCKETS = 24  # bucket i holds times in [2^(i-1), 2^i) microseconds
+FRAME_BUDGET = 1000 / 60.0  # ms
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[int(fraction * (len(values) - 1))] if values else 0.0
+
+
+class FrameProfiler(object):
+    def __init__(self, window=WINDOW, budget=FRAME_BUDGET):
+        self.window = window
+        self.budget = budget
+        self.phases = PHASES + ('frame',)
+        # Rolling per-frame ms and session histograms, per phase
+        self.recent = {phase: array('f', [0.0]) * window for phase in self.phases}
+        self.histograms = {phase: [0] * HISTOGRAM_BUCKETS for phase in self.phases}
+        self.totals = dict.fromkeys(self.phases, 0.0)
+        self.current = dict.fromkeys(PHASES, 0.0)
+        # How often each phase was the largest part of a frame over budget
+        self.lateCauses = dict.fromkeys(PHASES, 0)
+        self.frames = 0
+        self.lateFrames = 0
+        self.overlay = False
+        self.last = perf_counter()
+
+    def begin(self):
+        for phase in self.current:
+            self.current[phase] = 0.0
+        self.last = perf_counter()
+
+    def mark(self, phase):
+        now = perf_counter()
+        self.current[phase] += now - self.last
+        self.last = now
+
+    def end(self, keep=True):
+        # Frames that are not gameplay (menus, game over) are dropped
+        if not keep:
+            return
+        slot = self.frames % self.window
+        work = 0.0
+        for phase, seconds in self.current.items():
+            self.add(phase, slot, seconds * 1000)
+            if phase not in IDLE_PHASES:
+                work += seconds * 1000
+        self.add('frame', slot, work)
+        if work > self.budget:
+            self.lateFrames += 1
+            worst = max((phase for phase in PHASES if phase not in IDLE_PHASES),
+                        key=self.current.get)
+            self.lateCauses[worst] += 1
+        self.frames += 1
+
+    def add(self, phase, slot, ms):
+        self.recent[phase][slot] = ms
+        self.totals[phase] += ms
+        bucket = min(int(ms * 1000).bit_length(), HISTOGRAM_BUCKETS - 1)
+        self.histograms[phase][bucket] += 1
+
+    def rolling(self, phase):
+        # (p50, p95, max) in ms over the last window of frames
+        values = self.recent[phase][:min(self.frames, self.window)]
+        return percentile(values, 0.5), percentile(values, 0.95), max(values) if values else 0.0
+
+    def table(self):
+        # Rows of cells: a header, then phase and rolling p50, p95 and max
+        rows = [('phase ms', 'p50', 'p95', 'max')]
+        for phase in self.phases:
+            rows.append((phase,) + tuple("{:.2f}".format(ms) for ms in self.rolling(phase)))
+        return rows
+
+    def summary(self):
+        lines = ["{:<11} {:>6} {:>6} {:>6}".format(*row) for row in self.table()]
+        lines.append("late frames: {} of {}".format(self.lateFrames, self.frames))
+        return lines
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            f.write("{} frames, {} over the {:.2f} ms budget\n".format(
+                self.frames, self.lateFrames, self.budget))
+            f.write("Largest phase of late frames: {}\n\n".format(
+                ", ".join("{} {}".format(phase, count)
+                          for phase, count in self.lateCauses.items() if count) or "none"))
+            f.write("Last {} frames (ms):\n".format(min(self.frames, self.window)))
+            for line in self.summary()[:-1]:
+                f.write(line + "\n")
+            f.write("\nSession histograms (frames per time bucket, upper bound in microseconds):\n")
+            f.write("{:<11} {:>8} ".format('phase', 'mean ms') +
+                    " ".join("{:>7}".format(1 << i) for i in range(HISTOGRAM_BUCKETS)) + "\n")
+            for phase in self.phases:
+                f.write("{:<11} {:8.3f} ".format(phase, self.totals[phase] / max(self.frames, 1)) +
+                        " ".join("{:>7}".format(count) for count in self.histograms[phase]) + "\n")
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+# Space Invaders - 2-Playered
+# Replays a session recorded by spaceinvaders.py (game_logs/replays/*.sirp)
+# headless and as fast as possible, checking that every enemy shot, mystery
+# ship and mystery score comes out the same and that the final results match
+# the ones logged when the session ended.
+#
+#   python3 replay.py game_logs/replays/20191127_094241_c.sirp
+
+import sys
+import time as ti
+from collections import defaultdict, deque
+
+from spaceinvaders import (INPUT_FIRE, INPUT_KEYS, REPLAY_END, REPLAY_EVENTS, REPLAY_HEADER,
+                           REPLAY_HEADER_V1, REPLAY_INPUT, REPLAY_LONG_STEP, REPLAY_MAGIC,
+                           REPLAY_RECORDS, REPLAY_START, REPLAY_STEP, REPLAY_VERSION, SpaceInvaders)
+
+
+def read_replay(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < REPLAY_HEADER_V1.size:
+        raise ValueError("{} is too short to be a replay ({} bytes)".format(path, len(data)))
+    magic, version = data[:4], data[4]
+    if magic != REPLAY_MAGIC or version not in (1, REPLAY_VERSION):
+        raise ValueError("{} is not a version 1 or {} replay".format(path, REPLAY_VERSION))
+    if version == REPLAY_VERSION and len(data) < REPLAY_HEADER.size:
+        raise ValueError("{} is too short to be a replay ({} bytes)".format(path, len(data)))
+    if version == 1:
+        _, _, seed, mode = REPLAY_HEADER_V1.unpack_from(data)
+        shields = False
+        pos = REPLAY_HEADER_V1.size
+    else:
+        _, _, seed, mode, shields = REPLAY_HEADER.unpack_from(data)
+        pos = REPLAY_HEADER.size
+    records = []
+    while pos < len(data):
+        record = REPLAY_RECORDS[data[pos]]
+        if pos + record.size > len(data):
+            break  # session died mid-write
+        records.append(record.unpack_from(data, pos))
+        pos += record.size
+    return seed, mode.decode(), shields, records
+
+
+class EventChecker(object):
+    # Stands in for the recorder and compares the events the game emits with
+    # the ones that were recorded for the same start or step
+    def __init__(self):
+        self.expected = deque()
+        self.checked = 0
+        self.mismatches = []
+
+    def expect(self, events):
+        self.expected.extend(events)
+
+    def event(self, tag, value):
+        self.checked += 1
+        recorded = self.expected.popleft() if self.expected else None
+        if recorded != (tag, value):
+            self.mismatches.append((self.checked, recorded, (tag, value)))
+
+    def finish_step(self):
+        while self.expected:
+            self.mismatches.append((self.checked, self.expected.popleft(), None))
+
+    def start(self, currentTime):
+        pass
+
+    def step(self, currentTime, keys, humanShoot):
+        pass
+
+
+def replay(path):
+    seed, mode, shields, records = read_replay(path)
+    if not any(record[0] == REPLAY_START for record in records):
+        raise ValueError("{} has no start record (the session ended before a game started)".format(path))
+    checker = EventChecker()
+    game = SpaceInvaders(mode, headless=True, seed=seed, recorder=checker, shields=shields)
+    keys = defaultdict(bool)
+    humanShoot = False
+    logged = None
+    steps = 0
+    currentTime = 0
+    i = 0
+    while i < len(records):
+        record = records[i]
+        i += 1
+        events = []
+        while i < len(records) and records[i][0] in REPLAY_EVENTS:
+            events.append(records[i])
+            i += 1
+        checker.expect(events)
+        tag = record[0]
+        if tag == REPLAY_START:
+            currentTime = game.currentTime = record[1]
+            game.start_game()
+        elif tag in (REPLAY_STEP, REPLAY_LONG_STEP):
+            currentTime += record[1]
+            game.step(currentTime, keys, humanShoot)
+            steps += 1
+        elif tag == REPLAY_INPUT:
+            for bit, k in enumerate(INPUT_KEYS):
+                keys[k] = bool(record[1] & (1 << bit))
+            humanShoot = bool(record[1] & INPUT_FIRE)
+        elif tag == REPLAY_END:
+            logged = (record[1:5], record[5:9])
+        checker.finish_step()
+    return game, steps, checker, logged
+
+
+if __name__ == '__main__':
+    start = ti.time()
+    try:
+        game, steps, checker, logged = replay(sys.argv[1])
+    except ValueError as e:
+        sys.exit(str(e))
+    elapsed = max(ti.time() - start, 1e-9)
+    human, other = game.results()
+    print("Human: {}".format(human))
+    print("AI: {}".format(other))
+    print("{} steps ({:.0f}x real time), {} events checked".format(
+        steps, steps / 60.0 / elapsed, checker.checked))
+    ok = not checker.mismatches
+    for index, recorded, replayed in checker.mismatches[:10]:
+        print("Event {}: recorded {}, replayed {}".format(index, recorded, replayed))
+    if logged is None:
+        print("Recording has no logged result (session did not exit cleanly)")
+    elif logged != (tuple(int(v) for v in human), tuple(int(v) for v in other)):
+        print("Logged result differs: Human {}, AI {}".format(*logged))
+        ok = False
+    print("OK" if ok else "MISMATCH")
+    sys.exit(0 if ok else 1)
@@ -3,18 +3,34 @@
 # Space Invaders - 2-Playered
 # By Simon Mendelsohn (adapted from code by Lee Robinson)
 
+import time as ti
+LAUNCH_TIME = ti.perf_counter()  # start of the time to first frame
+
 from pygame import *
+import os
 import sys
-from os.path import abspath, dirname
+from os.path import abspath, basename, dirname
+from collections import OrderedDict, defaultdict, namedtuple
+import math
 import random
+import struct
+import threading
 from datetime import datetime
-import time as ti
+
+import assets
+import telemetry
+from profiler import FrameProfiler, percentile
 
 # Paths
 BASE_PATH = abspath(dirname(__file__))
 FONT_PATH = BASE_PATH + '/fonts/'
 IMAGE_PATH = BASE_PATH + '/images/'
 SOUND_PATH = BASE_PATH + '/sounds/'
+REPLAY_PATH = BASE_PATH + '/game_logs/replays/'
+TELEMETRY_PATH = BASE_PATH + '/game_logs/telemetry/'
+PROFILE_PATH = BASE_PATH + '/game_logs/profiles/'
+SNAPSHOT_PATH = BASE_PATH + '/game_logs/snapshots/'
+BUNDLE_PATH = BASE_PATH + '/assets.bundle'
 
 # Colors (R, G, B)
 WHITE = (255, 255, 255)
@@ -24,15 +40,8 @@ BLUE = (80, 255, 239)
 PURPLE = (203, 0, 255)
 RED = (237, 28, 36)
 
-mode = "d"
-if len(sys.argv) > 1:
-    if sys.argv[1] == "c":
-        mode = "c"
-    elif sys.argv[1] == "p":
-        mode = "p"
-
 SCREEN_WIDTH, SCREEN_HEIGHT = 800, 600
-SCREEN = display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+HUD_AREA = Rect(0, 0, SCREEN_WIDTH, 35)  # scores and lives along the top
 FONT = FONT_PATH + 'space_invaders.ttf'
 IMG_NAMES = ['ship', 'avery', 'jordan', 'mystery',
              'enemy1_1', 'enemy1_2',
@@ -40,24 +49,365 @@ IMG_NAMES = ['ship', 'avery', 'jordan', 'mystery',
              'enemy3_1', 'enemy3_2',
              'explosionblue', 'explosiongreen', 'explosionpurple',
              'laser', 'enemylaser'] # avery and jordan are the AIs; blue and pink versions of 'ship'
-IMAGES = {name: image.load(IMAGE_PATH + '{}.png'.format(name)).convert_alpha() for name in IMG_NAMES}
+IMAGE_FILES = {name: '{}.png'.format(name) for name in IMG_NAMES}
+IMAGE_FILES['background'] = 'background.jpg'
+OPAQUE_IMAGES = ('background',)
+# Decoded on first use, from the asset bundle if it is up to date, and
+# converted to the screen format once a window exists
+IMAGES = {}
+# Scaled variants of IMAGES, built once per (name, size) and shared by every sprite
+SCALED_IMAGES = {}
+ASSET_STATS = {'hits': 0, 'misses': 0}
 
 BLOCKERS_POSITION = 450
+# Shields are bitmaps of SHIELD_WIDTH x SHIELD_HEIGHT px, the first at
+# SHIELD_LEFT and then one every SHIELD_SPACING px
+SHIELD_COUNT = 4
+SHIELD_WIDTH, SHIELD_HEIGHT = 90, 40
+SHIELD_LEFT, SHIELD_SPACING = 50, 200
+# Pixels a bullet knocks out of a shield, centred where it hits
+SHIELD_BLAST = ('x  x  x ',
+                ' xxxxx  ',
+                'xxxxxxx ',
+                ' xxxxxxx',
+                'xxxxxxx ',
+                ' xxxxx x',
+                'x  x  x ')
+SHIELD_BLAST_WIDTH, SHIELD_BLAST_HEIGHT = len(SHIELD_BLAST[0]), len(SHIELD_BLAST)
+SHIELD_BLAST_CELLS = [(x, y) for y, line in enumerate(SHIELD_BLAST)
+                      for x, cell in enumerate(line) if cell == 'x']
 ENEMY_DEFAULT_POSITION = 65
 ENEMY_MOVE_DOWN = 35
+# Formation lattice: enemies are ENEMY_WIDTH x ENEMY_HEIGHT, one every
+# COLUMN_SPACING/ROW_SPACING px, with an extra SIDE_GAP before column SIDE_COLUMNS
+ENEMY_WIDTH, ENEMY_HEIGHT = 40, 35
+COLUMN_SPACING, ROW_SPACING = 50, 45
+SIDE_COLUMNS, SIDE_GAP = 5, 150
+# The formation marches MARCH_MOVES steps of MARCH_STEP px, then drops
+# ENEMY_MOVE_DOWN and turns around
+MARCH_MOVES, MARCH_STEP = 15, 10
+
+
+def make_march_table():
+    # Origin of the formation, relative to where it started, after each move
+    # of one march cycle (right, drop, left, drop). The last entry is where the
+    # next cycle starts: back at x 0, two drops lower.
+    table = [(0, 0)]
+    x = y = moveNumber = 0
+    direction = 1
+    while len(table) <= 2 * (MARCH_MOVES + 1):
+        if moveNumber >= MARCH_MOVES:
+            direction *= -1
+            moveNumber = 0
+            y += ENEMY_MOVE_DOWN
+        else:
+            x += MARCH_STEP * direction
+            moveNumber += 1
+        table.append((x, y))
+    return table
+
+
+MARCH_TABLE = make_march_table()
+MARCH_CYCLE = len(MARCH_TABLE) - 1
+MARCH_CYCLE_DROP = MARCH_TABLE[-1][1]
+
+# Every sample the game plays, with the volume it is played at
+SOUND_VOLUMES = {'shoot': 0.2, 'shoot2': 0.2, 'invaderkilled': 0.2,
+                 'mysterykilled': 0.2, 'shipexplosion': 0.2,
+                 'mysteryentered': 0.3,
+                 '0': 0.5, '1': 0.5, '2': 0.5, '3': 0.5}
+# Mixer channels: 0 is kept for the march notes, 1 for the mystery ship,
+# the rest are shared by the effects
+SOUND_CHANNELS = 8
+# It seems, in Linux buffersize=512 is not enough, use 4096 to prevent:
+#   ALSA lib pcm.c:7963:(snd_pcm_recover) underrun occurred
+MIXER_SETTINGS = (44100, -16, 1, 4096)  # frequency, size, channels, buffer
+
+# Rendered strings kept around; enough for every label plus recent score values
+TEXT_CACHE_SIZE = 128
+BULLET_POOL_SIZE = 32
+
+# Milliseconds an AI policy may take per call before it counts as an overrun
+AI_BUDGET_MS = 4.0
+# Enemy bullets above this y are not yet a threat to the ships
+THREAT_TOP = 300
+THREAT_BUCKET = 32
+
+# Replay stream: a header, then one tagged record per game start, step, input
+# change and simulation event, and the final results when the session exits
+REPLAY_MAGIC = b'SIRP'
+REPLAY_HEADER = struct.Struct('<4sBIc?')  # magic, version, seed, mode, shields
+REPLAY_VERSION = 2
+# Version 1 had no shields flag; those sessions were all played without them
+REPLAY_HEADER_V1 = struct.Struct('<4sBIc')
+REPLAY_START, REPLAY_STEP, REPLAY_LONG_STEP, REPLAY_INPUT = 1, 2, 3, 4
+REPLAY_ENEMY_FIRE, REPLAY_MYSTERY, REPLAY_MYSTERY_SCORE, REPLAY_END = 5, 6, 7, 8
+REPLAY_EVENTS = (REPLAY_ENEMY_FIRE, REPLAY_MYSTERY, REPLAY_MYSTERY_SCORE)
+REPLAY_RECORDS = {REPLAY_START: struct.Struct('<BI'),  # absolute time
+                  REPLAY_STEP: struct.Struct('<BH'),  # ms since the last record
+                  REPLAY_LONG_STEP: struct.Struct('<BI'),
+                  REPLAY_INPUT: struct.Struct('<BB'),  # INPUT_KEYS bits, then fire
+                  REPLAY_ENEMY_FIRE: struct.Struct('<BB'),  # column
+                  REPLAY_MYSTERY: struct.Struct('<Bb'),  # direction
+                  REPLAY_MYSTERY_SCORE: struct.Struct('<BH'),
+                  REPLAY_END: struct.Struct('<BiBHHiBHH')}  # results()
+# Snapshot: the complete state of a game in progress (see SpaceInvaders.snapshot).
+# The game record, the random generator, the formation and its alive cells,
+# what allSprites holds in order, then one record per mystery and bullet in
+# that order, one per explosion and the shield bitmaps.
+SNAPSHOT_MAGIC = b'SISN'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_GAME = struct.Struct('<4sBcI?i6i4iB6?bB4hbHBB')
+SNAPSHOT_RANDOM = struct.Struct('<B625I?d')  # version, state, has gauss, gauss
+SNAPSHOT_FORMATION = struct.Struct('<BBHIihhhhBB')
+SNAPSHOT_MYSTERY = struct.Struct('<hhbi??')  # x, y, direction, timer, playSound, visible
+SNAPSHOT_BULLET = struct.Struct('<hhbBB')  # x, y, direction, speed, origin
+SNAPSHOT_EXPLOSION = struct.Struct('<BHhhii')  # kind, row or score, x, y, timer, passed
+# What each sprite in allSprites is
+ORDER_PLAYER, ORDER_OTHER, ORDER_MYSTERY, ORDER_BULLET = range(4)
+SNAPSHOT_ORIGINS = ('human', 'other', 'enemy')
+# Seconds of wall time between the snapshots a windowed game keeps for
+# --resume (turbo games are not saved) and between flushes of the replay
+AUTOSAVE_INTERVAL = 5.0
+
+INPUT_KEYS = (K_LEFT, K_RIGHT, K_a, K_d)
+INPUT_FIRE = 1 << len(INPUT_KEYS)
+
+# Simulated milliseconds per step, with or without a window
+FRAME_TIME = 1000 / 60.0
+RENDER_FPS = 60
+MAX_CATCH_UP = 5  # steps run for one drawn frame before the game slows down (at RENDER_FPS)
+MAX_HEADLESS_FRAMES = 60 * 60 * 30
+
+# Frame profiler overlay, toggled with F3; redrawn every OVERLAY_REFRESH frames
+PROFILE_KEY = K_F3
+OVERLAY_REFRESH = 30
+OVERLAY_POSITION = (5, 330)
+OVERLAY_COLUMNS = (0, 100, 145, 190)
+
+# Events are stamped as they come off the SDL queue, which is polled every
+# INPUT_POLL_MS while waiting for the next frame; presses of the human's keys
+# are timed until the frame that shows their effect is on screen
+INPUT_POLL_MS = 1
+LATENCY_KEYS = {K_SPACE: 0, K_LEFT: 1, K_RIGHT: 2}
+LATENCY_ACTIONS = ('fire', 'left', 'right')
+
+
+BUNDLE = None
+
+
+def get_bundle():
+    # Mapped on first use; False when there is no up to date bundle
+    global BUNDLE
+    if BUNDLE is None:
+        BUNDLE = False
+        if assets.is_fresh(BUNDLE_PATH, asset_files()):
+            try:
+                BUNDLE = assets.AssetBundle(BUNDLE_PATH)
+            except ValueError:
+                pass
+    return BUNDLE
+
+
+def asset_files():
+    # Every source file that goes into the bundle
+    return ([IMAGE_PATH + filename for filename in IMAGE_FILES.values()] + [FONT] +
+            [SOUND_PATH + '{}.wav'.format(name) for name in SOUND_VOLUMES])
+
+
+def build_bundle(path=BUNDLE_PATH):
+    images = {name: image.load(IMAGE_PATH + filename) for name, filename in IMAGE_FILES.items()}
+    with open(FONT, 'rb') as f:
+        fonts = {basename(FONT): f.read()}
+    # Sounds are stored as the mixer plays them, so this needs the audio
+    # device the game will use
+    sounds = {}
+    mixerFormat = (0, 0, 0)
+    mixer.pre_init(*MIXER_SETTINGS)
+    try:
+        mixer.init()
+    except error as e:
+        print("No mixer ({}); the game will load the sounds from {}".format(e, SOUND_PATH))
+    else:
+        mixerFormat = mixer.get_init()
+        for name in SOUND_VOLUMES:
+            sounds[name] = mixer.Sound(SOUND_PATH + '{}.wav'.format(name)).get_raw()
+    assets.build(path, images, fonts, sounds, mixerFormat)
+    print("Wrote {} ({} images, {} fonts, {} sounds, {} bytes)".format(
+        path, len(images), len(fonts), len(sounds), os.path.getsize(path)))
+
+
+def load_image(name):
+    bundle = get_bundle()
+    if bundle and bundle.has(assets.IMAGE, name):
+        surface = bundle.image(name)
+    else:
+        surface = image.load(IMAGE_PATH + IMAGE_FILES[name])
+    if display.get_surface() is not None:
+        surface = convert_image(name, surface)
+    IMAGES[name] = surface
+    return surface
+
+
+def convert_image(name, surface):
+    if name in OPAQUE_IMAGES:
+        return surface.convert()
+    return surface.convert_alpha()
+
+
+def get_image(name, size=None):
+    if size is None:
+        surface = IMAGES.get(name)
+        if surface is None:
+            surface = load_image(name)
+        return surface
+    key = (name, size)
+    scaled = SCALED_IMAGES.get(key)
+    if scaled is None:
+        ASSET_STATS['misses'] += 1
+        scaled = SCALED_IMAGES[key] = transform.scale(get_image(name), size)
+    else:
+        ASSET_STATS['hits'] += 1
+    return scaled
+
+
+def surface_bytes(surface):
+    return surface.get_pitch() * surface.get_height()
+
+
+def asset_stats():
+    stats = dict(ASSET_STATS)
+    stats['variants'] = len(SCALED_IMAGES)
+    stats['sourceBytes'] = sum(surface_bytes(img) for img in IMAGES.values())
+    stats['variantBytes'] = sum(surface_bytes(img) for img in SCALED_IMAGES.values())
+    return stats
+
+
+class SoundBank(object):
+    def __init__(self, channels=SOUND_CHANNELS):
+        mixer.set_num_channels(channels)
+        mixer.set_reserved(2)
+        self.musicChannel = mixer.Channel(0)
+        self.mysteryChannel = mixer.Channel(1)
+        self.sounds = {}
+        bundle = get_bundle()
+        for name, volume in SOUND_VOLUMES.items():
+            sound = None
+            if bundle and bundle.has(assets.SOUND, name):
+                sound = bundle.sound(name)
+            if sound is None:
+                sound = mixer.Sound(SOUND_PATH + '{}.wav'.format(name))
+            sound.set_volume(volume)
+            self.sounds[name] = sound
+
+    def play(self, name):
+        # Steals the longest playing effect channel when all are busy
+        channel = mixer.find_channel(True)
+        if channel is not None:
+            channel.play(self.sounds[name])
+
+    def play_note(self, index):
+        self.musicChannel.play(self.sounds[str(index)])
+
+
+SOUND_BANK = None
+
+
+def get_sound_bank():
+    # Decoded once per process, on first use after the mixer is initialised
+    global SOUND_BANK
+    if SOUND_BANK is None:
+        SOUND_BANK = SoundBank()
+    return SOUND_BANK
+
+
+class ReplayRecorder(object):
+    def __init__(self, path, seed, mode, shields=False):
+        self.file = open(path, 'wb')
+        self.file.write(REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, seed, mode.encode(), shields))
+        self.time = 0
+        self.input = None
+
+    def write(self, tag, *values):
+        self.file.write(REPLAY_RECORDS[tag].pack(tag, *values))
+
+    def start(self, currentTime):
+        self.time = currentTime
+        self.write(REPLAY_START, currentTime)
+        self.flush()
+
+    def flush(self):
+        # So a session that is killed leaves a replay up to the last flush
+        self.file.flush()
+
+    def step(self, currentTime, keys, humanShoot):
+        bits = sum(1 << i for i, k in enumerate(INPUT_KEYS) if keys[k])
+        if humanShoot:
+            bits |= INPUT_FIRE
+        if bits != self.input:
+            self.write(REPLAY_INPUT, bits)
+            self.input = bits
+        delta = currentTime - self.time
+        self.write(REPLAY_STEP if delta <= 0xffff else REPLAY_LONG_STEP, delta)
+        self.time = currentTime
+
+    def event(self, tag, value):
+        self.write(tag, value)
+
+    def end(self, results):
+        human, other = results
+        self.write(REPLAY_END, *(human + other))
+        self.file.close()
+
+
+class SnapshotWriter(object):
+    # Keeps the latest snapshot of a session on disk for --resume. The game
+    # thread only hands the bytes over; a background thread writes them, so
+    # the frame loop never waits on the disk.
+    def __init__(self, path):
+        self.path = path
+        self.latest = None
+        self.stopped = False
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='snapshots')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def save(self, data):
+        self.latest = data
+        self.ready.set()
+
+    def run(self):
+        while True:
+            self.ready.wait()
+            self.ready.clear()
+            if self.stopped:
+                return
+            # Replaced whole, so a crash never leaves half of a snapshot
+            with open(self.path + '.tmp', 'wb') as f:
+                f.write(self.latest)
+            os.replace(self.path + '.tmp', self.path)
+
+    def close(self):
+        # Only a session that did not exit cleanly needs resuming
+        self.stopped = True
+        self.ready.set()
+        self.thread.join()
+        if os.path.exists(self.path):
+            os.remove(self.path)
 
 
 class Ship(sprite.Sprite):
-    def __init__(self, human=True):
+    def __init__(self, human=True, mode="d"):
         sprite.Sprite.__init__(self)
         self.human = human
-        self.image = IMAGES['ship']
+        self.image = get_image('ship')
         self.direction = -1
         if not human:
             if mode != "c":
-                self.image = IMAGES['avery'] # blue
+                self.image = get_image('avery') # blue
             else:
-                self.image = IMAGES['jordan'] # pink
+                self.image = get_image('jordan') # pink
         if self.human:
             self.rect = self.image.get_rect(topleft=(200, 540))
         else:
@@ -72,44 +422,95 @@ class Ship(sprite.Sprite):
             self.rect.x -= self.speed
         if keys[right] and self.rect.x < 740:
             self.rect.x += self.speed
-        game.screen.blit(self.image, self.rect)
+
+    def draw(self, surface):
+        return surface.blit(self.image, self.rect)
 
 
 class Bullet(sprite.Sprite):
-    def __init__(self, xpos, ypos, direction, speed, filename, origin):
+    def __init__(self, xpos, ypos, direction, speed, filename, origin, pool=None):
         sprite.Sprite.__init__(self)
-        self.image = IMAGES[filename]
-        self.rect = self.image.get_rect(topleft=(xpos, ypos))
+        self.pool = pool
+        self.inUse = False
+        self.rect = Rect(0, 0, 0, 0)
+        self.reset(xpos, ypos, direction, speed, filename, origin)
+
+    def reset(self, xpos, ypos, direction, speed, filename, origin):
+        self.image = get_image(filename)
+        self.rect.size = self.image.get_size()
+        self.rect.topleft = (xpos, ypos)
         self.speed = speed
         self.direction = direction
         self.origin = origin
 
-    def update(self, keys, *args):
-        game.screen.blit(self.image, self.rect)
+    def update(self, *args):
         self.rect.y += self.speed * self.direction
         if self.rect.y < 15 or self.rect.y > 600:
             self.kill()
 
+    def kill(self):
+        sprite.Sprite.kill(self)
+        if self.pool is not None and self.inUse:
+            self.inUse = False
+            self.pool.free.append(self)
+
+    def draw(self, surface):
+        return surface.blit(self.image, self.rect)
+
+
+class BulletPool(object):
+    # Bullets are recycled rather than created for every shot: acquire takes
+    # one off the free list and kill puts it back. If all of them are in the
+    # air, the pool grows by one.
+    def __init__(self, capacity=BULLET_POOL_SIZE):
+        self.bullets = [Bullet(0, 0, 1, 0, 'laser', None, self) for _ in range(capacity)]
+        self.free = list(self.bullets)
+        self.grown = 0
+
+    def acquire(self, xpos, ypos, direction, speed, filename, origin, *groups):
+        if self.free:
+            bullet = self.free.pop()
+        else:
+            bullet = Bullet(xpos, ypos, direction, speed, filename, origin, self)
+            self.bullets.append(bullet)
+            self.grown += 1
+        bullet.reset(xpos, ypos, direction, speed, filename, origin)
+        bullet.inUse = True
+        bullet.add(*groups)
+        return bullet
+
+    def reclaim(self):
+        # Takes back every bullet still in the air, e.g. from a finished round
+        for bullet in self.bullets:
+            bullet.kill()
+
 
 class Enemy(sprite.Sprite):
+    # Has no position or animation frame of its own: both come from the
+    # EnemiesGroup it is added to, its lattice cell and the march so far
     def __init__(self, row, column):
         sprite.Sprite.__init__(self)
         self.row = row
         self.column = column
         self.images = []
         self.load_images()
-        self.index = 0
-        self.image = self.images[self.index]
-        self.rect = self.image.get_rect()
+        self.formation = None
+        self.offsetX = EnemiesGroup.column_offset(column)
+        self.offsetY = row * ROW_SPACING
 
-    def toggle_image(self):
-        self.index += 1
-        if self.index >= len(self.images):
-            self.index = 0
-        self.image = self.images[self.index]
+    @property
+    def image(self):
+        return self.images[self.formation.moveCount & 1]
 
-    def update(self, *args):
-        game.screen.blit(self.image, self.rect)
+    @property
+    def rect(self):
+        return Rect(self.formation.originX + self.offsetX, self.formation.originY + self.offsetY,
+                    ENEMY_WIDTH, ENEMY_HEIGHT)
+
+    def draw(self, surface):
+        formation = self.formation
+        return surface.blit(self.images[formation.moveCount & 1],
+                            (formation.originX + self.offsetX, formation.originY + self.offsetY))
 
     def load_images(self):
         images = {0: ['1_2', '1_1'],
@@ -118,13 +519,13 @@ class Enemy(sprite.Sprite):
                   3: ['3_1', '3_2'],
                   4: ['3_1', '3_2'],
                   }
-        img1, img2 = (IMAGES['enemy{}'.format(img_num)] for img_num in images[self.row])
-        self.images.append(transform.scale(img1, (40, 35)))
-        self.images.append(transform.scale(img2, (40, 35)))
+        img1, img2 = ('enemy{}'.format(img_num) for img_num in images[self.row])
+        self.images.append(get_image(img1, (40, 35)))
+        self.images.append(get_image(img2, (40, 35)))
 
 
 class EnemiesGroup(sprite.Group):
-    def __init__(self, columns, rows):
+    def __init__(self, columns, rows, enemyPosition, currentTime, rng):
         sprite.Group.__init__(self)
         self.enemies = [[None] * columns for _ in range(rows)]
         self.columns = columns
@@ -136,38 +537,54 @@ class EnemiesGroup(sprite.Group):
         '''
         # self.rightAddMove = 0
         self.moveTime = 600
-        self.direction = 1
-        self.moves = 15  # number of moves before turning
-        self.moveNumber = 0  # number of moves done already
-        self.timer = time.get_ticks()
-        self.bottom = game.enemyPosition + ((rows - 1) * 45) + 35
+        self.moveCount = 0  # moves done so far, an index into the march
+        self.clearedMove = -1  # moveCount when the shields were last cleared under it
+        self.timer = currentTime
+        self.random = rng
+        # Position of the (0, 0) lattice cell, taken from MARCH_TABLE; the
+        # enemies derive their rects from it
+        self.startY = enemyPosition
+        self.originX = 0
+        self.originY = enemyPosition
+        self.bottom = enemyPosition + ((rows - 1) * 45) + 35
         self._aliveColumns = list(range(columns))
         self.leftAliveColumn = 0
         self.rightAliveColumn = columns - 1
+        # Kept up to date on every add and kill so no query has to scan the grid
+        self.columnCounts = [0] * columns
+        self.columnBottom = [-1] * columns  # lowest alive row of each column
+        self.rowCounts = [0] * rows
+        self.topRow = rows
+        self.bottomRow = -1
+        # The whole lattice pre-drawn once per animation frame, so a frame is
+        # one blit; built on first draw, kills only clear their cell
+        self.images = None
 
     def update(self, current_time):
         if current_time - self.timer > self.moveTime:
-            if self.moveNumber >= self.moves:
-                self.direction *= -1
-                self.moveNumber = 0
+            self.moveCount += 1
+            cycles, move = divmod(self.moveCount, MARCH_CYCLE)
+            x, y = MARCH_TABLE[move]
+            originY = self.startY + cycles * MARCH_CYCLE_DROP + y
+            if originY != self.originY:
                 self.bottom = 0
-                for enemy in self:
-                    enemy.rect.y += ENEMY_MOVE_DOWN
-                    enemy.toggle_image()
-                    if self.bottom < enemy.rect.y + 35:
-                        self.bottom = enemy.rect.y + 35
-            else:
-                for enemy in self:
-                    enemy.rect.x += (10 * self.direction)
-                    enemy.toggle_image()
-                self.moveNumber += 1
-
+                if self.bottomRow >= 0:
+                    self.bottom = originY + self.bottomRow * ROW_SPACING + ENEMY_HEIGHT
+            self.originX = x
+            self.originY = originY
             self.timer += self.moveTime
 
     def add_internal(self, *sprites):
         super(EnemiesGroup, self).add_internal(*sprites)
+        self.images = None
         for s in sprites:
+            s.formation = self
             self.enemies[s.row][s.column] = s
+            self.columnCounts[s.column] += 1
+            self.columnBottom[s.column] = max(self.columnBottom[s.column], s.row)
+            self.rowCounts[s.row] += 1
+            self.topRow = min(self.topRow, s.row)
+            self.bottomRow = max(self.bottomRow, s.row)
 
     def remove_internal(self, *sprites):
         super(EnemiesGroup, self).remove_internal(*sprites)
@@ -175,15 +592,89 @@ class EnemiesGroup(sprite.Group):
             self.kill(s)
         self.update_speed()
 
+    def make_images(self):
+        size = (self.column_offset(self.columns - 1) + ENEMY_WIDTH,
+                (self.rows - 1) * ROW_SPACING + ENEMY_HEIGHT)
+        self.images = []
+        for frame in range(2):
+            surface = Surface(size, SRCALPHA)
+            for enemy in self:
+                # Cells never overlap, so taking the max with the clear surface
+                # copies each pixel and its alpha as is instead of blending it
+                surface.blit(enemy.images[frame], (enemy.offsetX, enemy.offsetY),
+                             special_flags=BLEND_RGBA_MAX)
+            self.images.append(surface)
+
+    def draw(self, surface):
+        # Blits the alive part of the formation; returns the rect drawn
+        area = self.bounds()
+        if area is None:
+            return None
+        if self.images is None:
+            self.make_images()
+        return surface.blit(self.images[self.moveCount & 1], area,
+                            area.move(-self.originX, -self.originY))
+
+    @staticmethod
+    def column_offset(column):
+        if column >= SIDE_COLUMNS:
+            return column * COLUMN_SPACING + SIDE_GAP
+        return column * COLUMN_SPACING
+
+    def cells_under(self, rect):
+        # Lattice cells whose enemy rect could overlap rect
+        x = rect.x - self.originX
+        y = rect.y - self.originY
+        firstRow = max(0, (y - ENEMY_HEIGHT) // ROW_SPACING + 1)
+        lastRow = min(self.rows - 1, -(-(y + rect.height) // ROW_SPACING) - 1)
+        columns = []
+        for first, offset in ((0, 0), (SIDE_COLUMNS, SIDE_GAP)):
+            last = SIDE_COLUMNS - 1 if first == 0 else self.columns - 1
+            low = max(first, (x - offset - ENEMY_WIDTH) // COLUMN_SPACING + 1)
+            high = min(last, -(-(x - offset + rect.width) // COLUMN_SPACING) - 1)
+            columns.extend(range(low, high + 1))
+        for row in range(firstRow, lastRow + 1):
+            for column in columns:
+                yield row, column
+
+    def collide(self, bullets):
+        # Same result as sprite.groupcollide(self, bullets, True, True), but only
+        # the cells under each bullet are tested. groupcollide visits enemies in
+        # (row, column) order, so a bullet goes to the first enemy it touches.
+        hits = {}
+        for bullet in bullets:
+            for row, column in self.cells_under(bullet.rect):
+                enemy = self.enemies[row][column]
+                if enemy is not None and enemy.rect.colliderect(bullet.rect):
+                    hits.setdefault((row, column), []).append(bullet)
+                    break
+        collided = {}
+        for cell in sorted(hits):
+            enemy = self.enemies[cell[0]][cell[1]]
+            collided[enemy] = hits[cell]
+            enemy.kill()
+            for bullet in hits[cell]:
+                bullet.kill()
+        return collided
+
     def is_column_dead(self, column):
-        return not any(self.enemies[row][column]
-                       for row in range(self.rows))
+        return self.columnCounts[column] == 0
 
     def random_bottom(self):
-        col = random.choice(self._aliveColumns)
-        col_enemies = (self.enemies[row - 1][col]
-                       for row in range(self.rows, 0, -1))
-        return next((en for en in col_enemies if en is not None), None)
+        col = self.random.choice(self._aliveColumns)
+        return self.enemies[self.columnBottom[col]][col]
+
+    def rightmost_x(self):
+        return self.originX + self.column_offset(self.rightAliveColumn)
+
+    def bounds(self):
+        # Rect around the alive enemies, or None once the formation is gone
+        if not self:
+            return None
+        left = self.originX + self.column_offset(self.leftAliveColumn)
+        top = self.originY + self.topRow * ROW_SPACING
+        return Rect(left, top, self.rightmost_x() + ENEMY_WIDTH - left,
+                    (self.bottomRow - self.topRow) * ROW_SPACING + ENEMY_HEIGHT)
 
     def update_speed(self):
         if len(self) == 1:
@@ -193,6 +684,19 @@ class EnemiesGroup(sprite.Group):
 
     def kill(self, enemy):
         self.enemies[enemy.row][enemy.column] = None
+        if self.images is not None:
+            for image in self.images:
+                image.fill((0, 0, 0, 0), (enemy.offsetX, enemy.offsetY, ENEMY_WIDTH, ENEMY_HEIGHT))
+        self.columnCounts[enemy.column] -= 1
+        self.rowCounts[enemy.row] -= 1
+        bottom = self.columnBottom[enemy.column]
+        while bottom >= 0 and self.enemies[bottom][enemy.column] is None:
+            bottom -= 1
+        self.columnBottom[enemy.column] = bottom
+        while self.bottomRow >= 0 and self.rowCounts[self.bottomRow] == 0:
+            self.bottomRow -= 1
+        while self.topRow < self.rows and self.rowCounts[self.topRow] == 0:
+            self.topRow += 1
         is_column_dead = self.is_column_dead(enemy.column)
         if is_column_dead:
             self._aliveColumns.remove(enemy.column)
@@ -210,54 +714,115 @@ class EnemiesGroup(sprite.Group):
                 is_column_dead = self.is_column_dead(self.leftAliveColumn)
 
 
-class Blocker(sprite.Sprite):
-    def __init__(self, size, color, row, column):
-        sprite.Sprite.__init__(self)
-        self.height = size
-        self.width = size
-        self.color = color
-        self.image = Surface((self.width, self.height))
-        self.image.fill(self.color)
-        self.rect = self.image.get_rect()
-        self.row = row
-        self.column = column
-
-    def update(self, keys, *args):
-        game.screen.blit(self.image, self.rect)
+class Shield(object):
+    # One shield as a bitmap with a byte per pixel. Hits erode the bitmap in
+    # place; once drawn, the shield keeps an image in which only the erased
+    # pixels are cleared, and the damaged screen rects are kept for render.
+    def __init__(self, number):
+        self.rect = Rect(SHIELD_LEFT + number * SHIELD_SPACING, BLOCKERS_POSITION,
+                         SHIELD_WIDTH, SHIELD_HEIGHT)
+        self.bitmap = bytearray(b'\x01') * (SHIELD_WIDTH * SHIELD_HEIGHT)
+        self.image = None
+        self.damaged = []
+
+    def hit(self, rect, direction):
+        # Erodes the shield where rect, moving up (-1) or down (1), first
+        # touches it; returns whether it did
+        clip = rect.clip(self.rect)
+        if not clip.width:
+            return False
+        left = clip.x - self.rect.x
+        top = clip.y - self.rect.y
+        rows = range(top, top + clip.height)
+        if direction < 0:
+            rows = reversed(rows)
+        for y in rows:
+            start = y * SHIELD_WIDTH
+            x = self.bitmap.find(1, start + left, start + left + clip.width)
+            if x >= 0:
+                self.blast(x - start, y + direction * (SHIELD_BLAST_HEIGHT // 2))
+                return True
+        return False
+
+    def blast(self, x, y):
+        left = x - SHIELD_BLAST_WIDTH // 2
+        top = y - SHIELD_BLAST_HEIGHT // 2
+        for dx, dy in SHIELD_BLAST_CELLS:
+            px = left + dx
+            py = top + dy
+            if 0 <= px < SHIELD_WIDTH and 0 <= py < SHIELD_HEIGHT and self.bitmap[py * SHIELD_WIDTH + px]:
+                self.bitmap[py * SHIELD_WIDTH + px] = 0
+                if self.image is not None:
+                    self.image.set_at((px, py), (0, 0, 0, 0))
+        self.damage(Rect(left, top, SHIELD_BLAST_WIDTH, SHIELD_BLAST_HEIGHT))
+
+    def clear(self, rect):
+        # Removes every pixel under rect, e.g. where enemies walk through; an
+        # area that was already empty is not damage
+        clip = rect.clip(self.rect)
+        if not clip.width:
+            return
+        area = clip.move(-self.rect.x, -self.rect.y)
+        cleared = False
+        for y in range(area.top, area.bottom):
+            start = y * SHIELD_WIDTH + area.left
+            if self.bitmap.find(1, start, start + area.width) >= 0:
+                self.bitmap[start:start + area.width] = bytes(area.width)
+                cleared = True
+        if cleared:
+            if self.image is not None:
+                self.image.fill((0, 0, 0, 0), area)
+            self.damage(area)
+
+    def damage(self, area):
+        # area is in shield coordinates; only tracked once there is an image
+        if self.image is not None:
+            self.damaged.append(area.move(self.rect.topleft).clip(self.rect))
+
+    def draw(self, surface, area=None):
+        if self.image is None:
+            self.image = Surface(self.rect.size, SRCALPHA)
+            for y in range(SHIELD_HEIGHT):
+                for x in range(SHIELD_WIDTH):
+                    if self.bitmap[y * SHIELD_WIDTH + x]:
+                        self.image.set_at((x, y), GREEN)
+        if area is None:
+            return surface.blit(self.image, self.rect)
+        return surface.blit(self.image, area, area.move(-self.rect.x, -self.rect.y))
 
 
 class Mystery(sprite.Sprite):
-    def __init__(self):
+    def __init__(self, currentTime, rng, soundBank):
         sprite.Sprite.__init__(self)
-        self.image = IMAGES['mystery']
-        self.image = transform.scale(self.image, (75, 35))
-        self.direction = random.choice([-1, 1])
+        self.image = get_image('mystery', (75, 35))
+        self.direction = rng.choice([-1, 1])
         if self.direction == 1:
             self.rect = self.image.get_rect(topleft=(-80, 45))
         else:
             self.rect = self.image.get_rect(topright=(880, 45))
         self.row = 5
         self.moveTime = 25000
-        self.timer = time.get_ticks()
-        self.mysteryEntered = mixer.Sound(SOUND_PATH + 'mysteryentered.wav')
-        self.mysteryEntered.set_volume(0.3)
+        self.timer = currentTime
+        self.soundBank = soundBank
         self.playSound = True
+        self.visible = False
 
     def update(self, keys, currentTime, *args):
         resetTimer = False
+        self.visible = False
         passed = currentTime - self.timer
         if passed > self.moveTime:
             if (self.rect.x < 0 or self.rect.x > 800) and self.playSound:
-                self.mysteryEntered.play()
+                self.play_sound()
                 self.playSound = False
             if self.rect.x < 840 and self.direction == 1:
-                self.mysteryEntered.fadeout(4000)
+                self.fadeout_sound()
                 self.rect.x += 2
-                game.screen.blit(self.image, self.rect)
+                self.visible = True
             if self.rect.x > -100 and self.direction == -1:
-                self.mysteryEntered.fadeout(4000)
+                self.fadeout_sound()
                 self.rect.x -= 2
-                game.screen.blit(self.image, self.rect)
+                self.visible = True
 
         if self.rect.x > 830:
             self.playSound = True
@@ -270,99 +835,177 @@ class Mystery(sprite.Sprite):
         if passed > self.moveTime and resetTimer:
             self.timer = currentTime
 
+    def play_sound(self):
+        if self.soundBank:
+            self.soundBank.mysteryChannel.play(self.soundBank.sounds['mysteryentered'])
+
+    def fadeout_sound(self):
+        if self.soundBank:
+            self.soundBank.mysteryChannel.fadeout(4000)
+
+    def stop_sound(self):
+        if self.soundBank:
+            self.soundBank.mysteryChannel.stop()
+
+    def draw(self, surface):
+        if self.visible:
+            return surface.blit(self.image, self.rect)
+
 
 class EnemyExplosion(sprite.Sprite):
-    def __init__(self, enemy, *groups):
+    def __init__(self, row, position, currentTime, *groups):
         super(EnemyExplosion, self).__init__(*groups)
-        self.image = transform.scale(self.get_image(enemy.row), (40, 35))
-        self.image2 = transform.scale(self.get_image(enemy.row), (50, 45))
-        self.rect = self.image.get_rect(topleft=(enemy.rect.x, enemy.rect.y))
-        self.timer = time.get_ticks()
+        self.row = row
+        self.image = get_image(self.get_image(row), (40, 35))
+        self.image2 = get_image(self.get_image(row), (50, 45))
+        self.rect = self.image.get_rect(topleft=position)
+        self.timer = currentTime
+        self.passed = 0
 
     @staticmethod
     def get_image(row):
         img_colors = ['purple', 'blue', 'blue', 'green', 'green']
-        return IMAGES['explosion{}'.format(img_colors[row])]
+        return 'explosion{}'.format(img_colors[row])
 
     def update(self, current_time, *args):
-        passed = current_time - self.timer
-        if passed <= 100:
-            game.screen.blit(self.image, self.rect)
-        elif passed <= 200:
-            game.screen.blit(self.image2, (self.rect.x - 6, self.rect.y - 6))
-        elif 400 < passed:
+        self.passed = current_time - self.timer
+        if 400 < self.passed:
             self.kill()
 
+    def draw(self, surface):
+        if self.passed <= 100:
+            return surface.blit(self.image, self.rect)
+        elif self.passed <= 200:
+            return surface.blit(self.image2, (self.rect.x - 6, self.rect.y - 6))
+
 
 class MysteryExplosion(sprite.Sprite):
-    def __init__(self, mystery, score, *groups):
+    def __init__(self, score, position, currentTime, *groups):
         super(MysteryExplosion, self).__init__(*groups)
-        self.text = Text(FONT, 20, str(score), WHITE,
-                         mystery.rect.x + 20, mystery.rect.y + 6)
-        self.timer = time.get_ticks()
+        self.score = score
+        self.position = position
+        # The font is only needed once something actually draws the explosion
+        self.text = None
+        self.timer = currentTime
+        self.passed = 0
 
     def update(self, current_time, *args):
-        passed = current_time - self.timer
-        if passed <= 200 or 400 < passed <= 600:
-            self.text.draw(game.screen)
-        elif 600 < passed:
+        self.passed = current_time - self.timer
+        if 600 < self.passed:
             self.kill()
 
+    def draw(self, surface):
+        if self.passed <= 200 or 400 < self.passed <= 600:
+            if self.text is None:
+                self.text = Text(FONT, 20, str(self.score), WHITE, *self.position)
+            return self.text.draw(surface)
+
 
 class ShipExplosion(sprite.Sprite):
-    def __init__(self, ship, *groups):
+    def __init__(self, position, currentTime, *groups):
         super(ShipExplosion, self).__init__(*groups)
-        self.image = IMAGES['ship']
-        self.rect = self.image.get_rect(topleft=(ship.rect.x, ship.rect.y))
-        self.timer = time.get_ticks()
+        self.image = get_image('ship')
+        self.rect = self.image.get_rect(topleft=position)
+        self.timer = currentTime
+        self.passed = 0
 
     def update(self, current_time, *args):
-        passed = current_time - self.timer
-        if 300 < passed <= 600:
-            game.screen.blit(self.image, self.rect)
-        elif 900 < passed:
+        self.passed = current_time - self.timer
+        if 900 < self.passed:
             self.kill()
 
+    def draw(self, surface):
+        if 300 < self.passed <= 600:
+            return surface.blit(self.image, self.rect)
+
 
 class Life(sprite.Sprite):
     def __init__(self, xpos, ypos):
         sprite.Sprite.__init__(self)
-        self.image = IMAGES['ship']
-        self.image = transform.scale(self.image, (23, 23))
-        self.rect = self.image.get_rect(topleft=(xpos, ypos))
+        self.rect = Rect(xpos, ypos, 23, 23)
 
-    def update(self, *args):
-        game.screen.blit(self.image, self.rect)
+    def draw(self, surface):
+        # Looked up here, as lives are made before the window (and the
+        # converted images) exist
+        return surface.blit(get_image('ship', self.rect.size), self.rect)
+
+
+FONTS = {}
+RENDERED_TEXT = OrderedDict()
+
+
+def load_font(textFont, size):
+    key = (textFont, size)
+    if key not in FONTS:
+        bundle = get_bundle()
+        if bundle and bundle.has(assets.FONT, basename(textFont)):
+            FONTS[key] = bundle.font(basename(textFont), size)
+        else:
+            FONTS[key] = font.Font(textFont, size)
+    return FONTS[key]
+
+
+def render_text(textFont, size, message, color):
+    # Least recently used strings are dropped once the cache is full
+    key = (textFont, message, size, color)
+    surface = RENDERED_TEXT.get(key)
+    if surface is None:
+        surface = load_font(textFont, size).render(message, True, color)
+        RENDERED_TEXT[key] = surface
+        if len(RENDERED_TEXT) > TEXT_CACHE_SIZE:
+            RENDERED_TEXT.popitem(last=False)
+    else:
+        RENDERED_TEXT.move_to_end(key)
+    return surface
 
 
 class Text(object):
     def __init__(self, textFont, size, message, color, xpos, ypos):
-        self.font = font.Font(textFont, size)
-        self.surface = self.font.render(message, True, color)
+        self.font = load_font(textFont, size)
+        self.surface = render_text(textFont, size, message, color)
         self.rect = self.surface.get_rect(topleft=(xpos, ypos))
 
     def draw(self, surface):
-        surface.blit(self.surface, self.rect)
+        return surface.blit(self.surface, self.rect)
+
+class BulletIndex(object):
+    # Enemy bullets that are low enough to matter, bucketed by x
+    def __init__(self, enemyBullets):
+        self.buckets = defaultdict(list)
+        for bullet in enemyBullets:
+            if bullet.rect.y >= THREAT_TOP:
+                self.buckets[bullet.rect.x // THREAT_BUCKET].append(bullet.rect.x)
+
+    def near(self, left, right):
+        # x of every indexed bullet with left <= x <= right
+        for bucket in range(left // THREAT_BUCKET, right // THREAT_BUCKET + 1):
+            for x in self.buckets.get(bucket, ()):
+                if left <= x <= right:
+                    yield x
+
 
-def updateAI(ai, enemies, enemyBullets, mode):
-    rightEnemy = leftEnemy = 0
-    for enemy in enemies:
-        if enemy.rect.x > rightEnemy:
-            rightEnemy = enemy.rect.x
-        if enemy.rect.x < leftEnemy:
-            leftEnemy = enemy.rect.x
+# What an AI policy sees of the game; built fresh for every call. budget is
+# the ms the call may take and snapshot() the whole game, for look-ahead.
+GameView = namedtuple('GameView', ['mode', 'currentTime', 'x', 'y', 'speed', 'direction',
+                                   'alive', 'playerX', 'rightEnemy', 'formation',
+                                   'mysteryX', 'mysteryDirection', 'threats',
+                                   'budget', 'snapshot'])
+# move is -1, 0 or 1 ship steps; fire None keeps the game's own firing rule
+AIAction = namedtuple('AIAction', ['move', 'direction', 'fire'])
+
+
+def updateAI(view):
+    rightEnemy = view.rightEnemy
 
     leftWall = 10
-    if mode != "c":
+    if view.mode != "c":
         leftWall = 410
 
     # dodge
     moveLeft = moveRight = True
     hit = False
-    for bullet in enemyBullets:
-        if bullet.rect.y < 300:
-            continue
-        diff = bullet.rect.x - ai.rect.x
+    for bulletX in view.threats.near(view.x - 29, view.x + 79):
+        diff = bulletX - view.x
         if (diff > -30 and diff < -1):
             moveLeft = False
         if diff >= -1 and diff <= 50:
@@ -370,56 +1013,88 @@ def updateAI(ai, enemies, enemyBullets, mode):
         if (diff > 50 and diff < 80):
             moveRight = False
 
-    if ai.rect.x < 10:
-        ai.direction = 1
-    elif ai.rect.x > 740:
-        ai.direction = -1
+    direction = view.direction
+    if view.x < 10:
+        direction = 1
+    elif view.x > 740:
+        direction = -1
 
+    move = 0
     if moveLeft and moveRight and hit:
-        ai.rect.x += ai.direction * ai.speed
-    elif ai.rect.x > 10 and moveLeft and hit:
-        ai.rect.x -= ai.speed
-    elif ai.rect.x < 740 and moveRight and hit:
-        ai.rect.x += ai.speed
-    elif ai.rect.x > rightEnemy and moveLeft and ai.rect.x > leftWall:
-        ai.rect.x -= ai.speed
-    elif (ai.rect.x < rightEnemy - 10 and moveRight) or (ai.rect.x < leftWall and moveRight):
-        ai.rect.x += ai.speed
+        move = direction
+    elif view.x > 10 and moveLeft and hit:
+        move = -1
+    elif view.x < 740 and moveRight and hit:
+        move = 1
+    elif view.x > rightEnemy and moveLeft and view.x > leftWall:
+        move = -1
+    elif (view.x < rightEnemy - 10 and moveRight) or (view.x < leftWall and moveRight):
+        move = 1
+    return AIAction(move, direction, None)
 
 
 class SpaceInvaders(object):
-    def __init__(self):
-        # It seems, in Linux buffersize=512 is not enough, use 4096 to prevent:
-        #   ALSA lib pcm.c:7963:(snd_pcm_recover) underrun occurred
-        mixer.pre_init(44100, -16, 1, 4096)  # for audio I think
-        init()  # pygame.init()
-        self.clock = time.Clock()
-        self.caption = display.set_caption('Space Invaders')
-        self.screen = SCREEN
-        self.background = image.load(IMAGE_PATH + 'background.jpg').convert()
+    def __init__(self, mode="d", headless=False, seed=None, aiPolicy=updateAI,
+                 aiBudget=AI_BUDGET_MS, recorder=None, shields=False):
+        self.mode = mode
+        # The logged sessions were all played without shields, so they are opt-in
+        self.useShields = shields
+        self.shields = []
+        if seed is None:
+            seed = random.randrange(1 << 32)
+        self.seed = seed
+        # Gets every start, step and random event; see ReplayRecorder
+        self.recorder = recorder
+        # telemetry.Telemetry for per-frame trajectories and events, if any
+        self.telemetry = None
+        # profiler.FrameProfiler timing each phase of a frame, if any
+        self.profiler = None
+        self.overlayLines = []
+        # (stamp, event) taken off the queue but not handled yet, and
+        # (action, stamp, handled) for key presses not on screen yet
+        self.events = []
+        self.unpresented = []
+        self.inputLatencies = [[] for _ in LATENCY_ACTIONS]
+        # Called with a GameView once per step; returns an AIAction
+        self.aiPolicy = aiPolicy
+        self.aiBudget = aiBudget
+        self.aiCalls = 0
+        self.aiOverruns = 0
+        self.aiTime = 0.0
+        self.aiFire = None
+        # Headless games never touch the display, the mixer or the frame clock
+        self.headless = headless
+        # Drawn frames per second, independent of the simulation rate; in
+        # turbo mode the simulation runs as fast as it can, without sound
+        self.renderFps = RENDER_FPS
+        self.turbo = False
+        self.random = random.Random(seed)
+        self.currentTime = 0
+        self.soundBank = None
+        self.noteIndex = 0
+        # The window is only opened once there is something to show; see open_window
+        self.screen = None
+        self.startup = []
+        self.firstFrame = None
+        # SnapshotWriter that main keeps an up to date snapshot in, if any
+        self.snapshots = None
+        self.savedAt = 0.0
+        self.bulletPool = BulletPool()
         self.startGame = False
         self.mainScreen = True
         self.gameOver = False
+        # Whether a game has been played since the last entry in the session
+        # log, and the game time it started at
+        self.unlogged = False
+        self.startedAt = 0
+        self.enemiesLanded = False
         # Counter for enemy starting position (increased each new round)
         self.enemyPosition = ENEMY_DEFAULT_POSITION
-        self.titleText = Text(FONT, 50, 'Space Invaders', WHITE, 164, 155)
-        self.titleText2 = Text(FONT, 25, 'Press any key to continue', WHITE,
-                               201, 225)
-        #self.gameOverText = Text(FONT, 50, 'Game Over', WHITE, 250, 270)
-        self.nextRoundText = Text(FONT, 50, 'Next Round', WHITE, 240, 270)
-        self.enemy1Text = Text(FONT, 25, '   =   10 pts', GREEN, 368, 270)
-        self.enemy2Text = Text(FONT, 25, '   =  20 pts', BLUE, 368, 320)
-        self.enemy3Text = Text(FONT, 25, '   =  30 pts', PURPLE, 368, 370)
-        self.enemy4Text = Text(FONT, 25, '   =  ?????', RED, 368, 420)
-        self.scoreText = Text(FONT, 20, 'Score', WHITE, 5, 5)
-        self.scoreTextO = Text(FONT, 20, 'Score', WHITE, 405, 5)
 
-        self.livesTextPlayer = Text(FONT, 20, 'Lives ', WHITE, 240, 5)
         self.lifePlayer1 = Life(315, 3)
         self.lifePlayer2 = Life(342, 3)
         self.lifePlayer3 = Life(369, 3)
 
-        self.livesTextOther = Text(FONT, 20, 'Lives ', WHITE, 640, 5)
         self.lifeOther = Life(715, 3)
         # self.lifeOther2 = Life(742, 3)
         # self.lifeOther3 = Life(769, 3)
@@ -431,70 +1106,162 @@ class SpaceInvaders(object):
         self.otherKillL = 0
         self.otherKillR = 0
 
+    def open_window(self):
+        # Sets up the display, the mixer and every asset the screens need.
+        # Nothing before this touches them, so importing the module and
+        # building a game (headless or not) stay cheap.
+        if self.screen is not None:
+            return
+        self.startup = [('imports', IMPORT_TIME), ('setup', ti.perf_counter())]
+        mixer.pre_init(*MIXER_SETTINGS)
+        init()  # pygame.init()
+        self.screen = display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        self.caption = display.set_caption('Space Invaders')
+        self.startup.append(('window', ti.perf_counter()))
+        for name, surface in list(IMAGES.items()):
+            IMAGES[name] = convert_image(name, surface)
+        # Variants scaled before the conversion would keep the old pixel format
+        SCALED_IMAGES.clear()
+        self.background = get_image('background')
+        self.make_backdrop()
+        self.dirtyRects = []
+        self.titleText = Text(FONT, 50, 'Space Invaders', WHITE, 164, 155)
+        self.titleText2 = Text(FONT, 25, 'Press any key to continue', WHITE,
+                               201, 225)
+        #self.gameOverText = Text(FONT, 50, 'Game Over', WHITE, 250, 270)
+        self.nextRoundText = Text(FONT, 50, 'Next Round', WHITE, 240, 270)
+        self.enemy1Text = Text(FONT, 25, '   =   10 pts', GREEN, 368, 270)
+        self.enemy2Text = Text(FONT, 25, '   =  20 pts', BLUE, 368, 320)
+        self.enemy3Text = Text(FONT, 25, '   =  30 pts', PURPLE, 368, 370)
+        self.enemy4Text = Text(FONT, 25, '   =  ?????', RED, 368, 420)
+        self.scoreText = Text(FONT, 20, 'Score', WHITE, 5, 5)
+        self.scoreTextO = Text(FONT, 20, 'Score', WHITE, 405, 5)
+        self.livesTextPlayer = Text(FONT, 20, 'Lives ', WHITE, 240, 5)
+        self.livesTextOther = Text(FONT, 20, 'Lives ', WHITE, 640, 5)
+        self.startup.append(('assets', ti.perf_counter()))
+
+    def report_startup(self, now):
+        self.firstFrame = (now - LAUNCH_TIME) * 1000
+        self.startup.append(('first frame', now))
+        stages = []
+        last = LAUNCH_TIME
+        for stage, end in self.startup:
+            stages.append("{} {:.0f} ms".format(stage, (end - last) * 1000))
+            last = end
+        print("First frame after {:.0f} ms ({}; assets from {})".format(
+            self.firstFrame, ", ".join(stages), "the bundle" if get_bundle() else "the source files"))
+
     def reset(self, player_score, other_score):
-        self.player = Ship(True)
-        self.other = Ship(False)
+        if not self.headless and not self.turbo:
+            self.create_audio()
+        self.bulletPool.reclaim()
+        self.player = Ship(True, self.mode)
+        self.other = Ship(False, self.mode)
         self.playerGroup = sprite.Group(self.player, self.other)
         self.explosionsGroup = sprite.Group()
         self.bullets = sprite.Group()
-        self.mysteryShip = Mystery()
+        self.mysteryShip = self.make_mystery()
         self.mysteryGroup = sprite.Group(self.mysteryShip)
         self.enemyBullets = sprite.Group()
         self.make_enemies()
-        self.allSprites = sprite.Group(self.player, self.enemies,
-                                       self.livesGroup, self.mysteryShip, self.other)
-        self.keys = key.get_pressed()
+        # The formation draws itself in one go and the lives are part of the
+        # HUD in the backdrop, so neither is in allSprites
+        self.allSprites = sprite.Group(self.player, self.mysteryShip, self.other)
+        if self.headless:
+            self.keys = defaultdict(bool)
+        else:
+            self.keys = key.get_pressed()
 
-        self.timer = time.get_ticks()
-        self.noteTimer = time.get_ticks()
-        self.shipTimer = time.get_ticks()
+        self.timer = self.currentTime
+        self.noteTimer = self.currentTime
+        self.shipTimer = self.currentTime
         self.player_score = player_score
         self.other_score = other_score
-        self.create_audio()
         self.makeNewPlayer = False
         self.makeNewOther = False
+        self.enemiesLanded = False
+        self.aiFire = None
 
-        if mode == "p":
+        if self.mode == "p":
             self.other.kill()
             self.lifeOther.kill()
         # else:
         #     self.lifePlayer2.kill()
         #     self.lifePlayer3.kill()
 
-    def make_blockers(self, number):
-        blockerGroup = sprite.Group()
-        for row in range(4):
-            for column in range(9):
-                blocker = Blocker(10, GREEN, row, column)
-                blocker.rect.x = 50 + (200 * number) + (column * blocker.width)
-                blocker.rect.y = BLOCKERS_POSITION + (row * blocker.height)
-                blockerGroup.add(blocker)
-        return blockerGroup
+    def start_game(self):
+        if not self.headless:
+            self.open_window()
+        # Only create shields on a new game, not a new round
+        self.make_shields()
+        self.livesGroup.add(self.lifePlayer1, self.lifePlayer2, self.lifePlayer3, self.lifeOther)
+        if self.recorder:
+            self.recorder.start(self.currentTime)
+        self.reset(0, 0)
+        self.humanKillL = 0
+        self.humanKillR = 0
+        self.otherKillL = 0
+        self.otherKillR = 0
+        self.startGame = True
+        self.mainScreen = False
+        self.unlogged = True
+        self.startedAt = self.currentTime
+
+    def is_running(self):
+        return (self.startGame and not self.enemiesLanded
+                and bool(self.enemies or self.explosionsGroup))
+
+    def make_shields(self):
+        self.shields = []
+        if self.useShields:
+            self.shields = [Shield(number) for number in range(SHIELD_COUNT)]
+        if not self.headless:
+            self.make_backdrop()
+
+    def make_backdrop(self):
+        # Everything that stays put during a round; dirty regions are restored from it
+        self.backdrop = self.background.copy()
+        draw.line(self.backdrop, WHITE, (400, 0), (400, 600), 1)  # middle line
+        for shield in self.shields:
+            shield.draw(self.backdrop)
+        # The HUD goes in at the next render, once there is a game to show
+        self.shownHud = None
+        self.fullRedraw = True
+
+    def draw_hud(self):
+        # Redraws the scores and lives in the backdrop
+        self.backdrop.blit(self.background, HUD_AREA, HUD_AREA)
+        draw.line(self.backdrop, WHITE, (400, HUD_AREA.top), (400, HUD_AREA.bottom - 1), 1)
+        self.scoreText.draw(self.backdrop)
+        Text(FONT, 20, str(self.player_score), GREEN, 85, 5).draw(self.backdrop)
+        self.scoreTextO.draw(self.backdrop)
+        Text(FONT, 20, str(self.other_score), GREEN, 485, 5).draw(self.backdrop)
+        self.livesTextPlayer.draw(self.backdrop)
+        if not self.lifePlayer1.alive():
+            draw.line(self.backdrop, RED, (238, 15), (310, 15), 3)
+        self.livesTextOther.draw(self.backdrop)
+        if not self.lifeOther.alive():
+            draw.line(self.backdrop, RED, (638, 15), (710, 15), 3)
+        for life in self.livesGroup:
+            life.draw(self.backdrop)
 
     def create_audio(self):
-        self.sounds = {}
-        for sound_name in ['shoot', 'shoot2', 'invaderkilled', 'mysterykilled',
-                           'shipexplosion']:
-            self.sounds[sound_name] = mixer.Sound(
-                SOUND_PATH + '{}.wav'.format(sound_name))
-            self.sounds[sound_name].set_volume(0.2)
-
-        self.musicNotes = [mixer.Sound(SOUND_PATH + '{}.wav'.format(i)) for i
-                           in range(4)]
-        for sound in self.musicNotes:
-            sound.set_volume(0.5)
-
+        self.soundBank = get_sound_bank()
         self.noteIndex = 0
 
+    def play_sound(self, name):
+        if self.soundBank:
+            self.soundBank.play(name)
+
     def play_main_music(self, currentTime):
         if currentTime - self.noteTimer > self.enemies.moveTime:
-            self.note = self.musicNotes[self.noteIndex]
+            if self.soundBank:
+                self.soundBank.play_note(self.noteIndex)
             if self.noteIndex < 3:
                 self.noteIndex += 1
             else:
                 self.noteIndex = 0
 
-            self.note.play()
             self.noteTimer += self.enemies.moveTime
 
     @staticmethod
@@ -502,10 +1269,38 @@ class SpaceInvaders(object):
         # type: (pygame.event.EventType) -> bool
         return evt.type == QUIT or (evt.type == KEYUP and evt.key == K_ESCAPE)
 
+    def collect_input(self):
+        # Stamps events with the perf_counter time they left the SDL queue
+        events = event.get()
+        if events:
+            stamp = ti.perf_counter()
+            self.events.extend((stamp, e) for e in events)
+
+    def poll_events(self):
+        self.collect_input()
+        events, self.events = self.events, []
+        return events
+
     def check_input(self):
+        # Polls the keyboard; returns whether the human pressed fire this frame
+        humanShoot = False
+        self.keys = key.get_pressed()
+        handled = ti.perf_counter()
+        for stamp, e in self.poll_events():
+            if self.should_exit(e):
+                self.makeExit()
+            if e.type == KEYDOWN and e.key in LATENCY_KEYS:
+                self.unpresented.append((LATENCY_KEYS[e.key], stamp, handled))
+            if e.type == KEYDOWN and e.key == K_SPACE:
+                humanShoot = True
+            if e.type == KEYDOWN and e.key == PROFILE_KEY and self.profiler:
+                self.profiler.overlay = not self.profiler.overlay
+        return humanShoot
+
+    def shoot(self, humanShoot):
         humanCanShoot = otherCanShoot = True
 
-        if mode != "c" and self.enemies.rightAliveColumn < 5:
+        if self.mode != "c" and self.enemies.rightAliveColumn < 5:
             otherCanShoot = False
 
         for mystery in self.mysteryGroup:
@@ -513,6 +1308,9 @@ class SpaceInvaders(object):
         if diff > 0 and diff < 50:
             otherCanShoot = True
 
+        if self.aiFire is not None:
+            otherCanShoot = self.aiFire
+
         for bullet in self.bullets:
             if bullet.origin == "human":
                 humanCanShoot = False
@@ -521,56 +1319,52 @@ class SpaceInvaders(object):
 
         if self.lifeOther.alive():
             if otherCanShoot:
-                bullet = Bullet(self.other.rect.x + 23,
-                                self.other.rect.y + 5, -1,
-                                15, 'laser', origin="other")
-                self.bullets.add(bullet)
-                self.allSprites.add(self.bullets)
-                self.sounds['shoot'].play()
-
-        self.keys = key.get_pressed()
-        for e in event.get():
-            if self.should_exit(e):
-                self.makeExit()
-            if e.type == KEYDOWN:
-                if e.key == K_SPACE and self.lifePlayer1.alive():
-                    if humanCanShoot:
-                        bullet = Bullet(self.player.rect.x + 23,
-                                        self.player.rect.y + 5, -1,
-                                        15, 'laser', origin="human")
-                        #self.myBullets.add(bullet)
-                        self.bullets.add(bullet)
-                        self.allSprites.add(self.bullets)
-                        self.sounds['shoot'].play()
+                bullet = self.bulletPool.acquire(self.other.rect.x + 23,
+                                                 self.other.rect.y + 5, -1, 15, 'laser', "other",
+                                                 self.bullets, self.allSprites)
+                self.trace(telemetry.SHOT, telemetry.ORIGINS["other"], bullet.rect.x, bullet.rect.y)
+                self.play_sound('shoot')
+
+        if humanShoot and self.lifePlayer1.alive():
+            if humanCanShoot:
+                bullet = self.bulletPool.acquire(self.player.rect.x + 23,
+                                                 self.player.rect.y + 5, -1, 15, 'laser', "human",
+                                                 self.bullets, self.allSprites)
+                self.trace(telemetry.SHOT, telemetry.ORIGINS["human"], bullet.rect.x, bullet.rect.y)
+                self.play_sound('shoot')
 
     def make_enemies(self):
-        enemies = EnemiesGroup(10, 5)
-        if mode == "p":
-            enemies = EnemiesGroup(5, 5)
+        enemies = EnemiesGroup(10, 5, self.enemyPosition, self.currentTime, self.random)
+        if self.mode == "p":
+            enemies = EnemiesGroup(5, 5, self.enemyPosition, self.currentTime, self.random)
         for row in range(5):
             for column in range(5):
-                enemy = Enemy(row, column)
-                enemy.rect.x = (column * 50)
-                enemy.rect.y = self.enemyPosition + (row * 45)
-                enemies.add(enemy)
+                enemies.add(Enemy(row, column))
 
-            if mode != "p":
+            if self.mode != "p":
                 for column in range(5,10):
-                    enemy = Enemy(row, column)
-                    enemy.rect.x = 400 + ((column - 5) * 50)
-                    enemy.rect.y = self.enemyPosition + (row * 45)
-                    enemies.add(enemy)
+                    enemies.add(Enemy(row, column))
 
         self.enemies = enemies
 
+    def make_mystery(self):
+        mystery = Mystery(self.currentTime, self.random, self.soundBank)
+        self.record(REPLAY_MYSTERY, mystery.direction)
+        return mystery
+
+    def record(self, tag, value):
+        if self.recorder:
+            self.recorder.event(tag, value)
+
     def make_enemies_shoot(self):
-        if (time.get_ticks() - self.timer) > 700 and self.enemies:
+        if (self.currentTime - self.timer) > 700 and self.enemies:
             enemy = self.enemies.random_bottom()
-            self.enemyBullets.add(
-                Bullet(enemy.rect.x + 14, enemy.rect.y + 20, 1, 5,
-                       'enemylaser', origin="enemy"))
-            self.allSprites.add(self.enemyBullets)
-            self.timer = time.get_ticks()
+            self.record(REPLAY_ENEMY_FIRE, enemy.column)
+            rect = enemy.rect
+            self.bulletPool.acquire(rect.x + 14, rect.y + 20, 1, 5, 'enemylaser', "enemy",
+                                    self.enemyBullets, self.allSprites)
+            self.trace(telemetry.SHOT, telemetry.ORIGINS["enemy"], rect.x + 14, rect.y + 20)
+            self.timer = self.currentTime
 
     def calculate_score(self, row, bulletX):
         scores = {0: 30,
@@ -578,7 +1372,7 @@ class SpaceInvaders(object):
                   2: 20,
                   3: 10,
                   4: 10,
-                  5: random.choice([50, 100, 150, 300])
+                  5: self.random.choice([50, 100, 150, 300])
                   }
 
         score = scores[row]
@@ -589,14 +1383,10 @@ class SpaceInvaders(object):
         return score
 
     def create_main_menu(self):
-        self.enemy1 = IMAGES['enemy3_1']
-        self.enemy1 = transform.scale(self.enemy1, (40, 40))
-        self.enemy2 = IMAGES['enemy2_2']
-        self.enemy2 = transform.scale(self.enemy2, (40, 40))
-        self.enemy3 = IMAGES['enemy1_2']
-        self.enemy3 = transform.scale(self.enemy3, (40, 40))
-        self.enemy4 = IMAGES['mystery']
-        self.enemy4 = transform.scale(self.enemy4, (80, 40))
+        self.enemy1 = get_image('enemy3_1', (40, 40))
+        self.enemy2 = get_image('enemy2_2', (40, 40))
+        self.enemy3 = get_image('enemy1_2', (40, 40))
+        self.enemy4 = get_image('mystery', (80, 40))
         self.screen.blit(self.enemy1, (318, 270))
         self.screen.blit(self.enemy2, (318, 320))
         self.screen.blit(self.enemy3, (318, 370))
@@ -605,15 +1395,15 @@ class SpaceInvaders(object):
     def check_collisions(self):
         sprite.groupcollide(self.bullets, self.enemyBullets, True, True)
 
-        enemyBulletDict = sprite.groupcollide(self.enemies, self.bullets,
-                                         True, True)
+        enemyBulletDict = self.enemies.collide(self.bullets)
         for enemy in enemyBulletDict.keys():
-            self.sounds['invaderkilled'].play()
-            EnemyExplosion(enemy, self.explosionsGroup)
-            self.gameTimer = time.get_ticks()
+            self.play_sound('invaderkilled')
+            EnemyExplosion(enemy.row, enemy.rect.topleft, self.currentTime, self.explosionsGroup)
+            self.gameTimer = self.currentTime
 
             for bullet in enemyBulletDict[enemy]:
                 self.calculate_score(enemy.row, bullet.rect.x)
+                self.trace(telemetry.KILL, telemetry.ORIGINS[bullet.origin], enemy.row, enemy.column)
 
                 # update for game_logs:
                 if enemy.column >= 5 and bullet.origin == "human":
@@ -628,12 +1418,15 @@ class SpaceInvaders(object):
         mysteryBulletDict = sprite.groupcollide(self.mysteryGroup, self.bullets,
                                               True, True)
         for mystery in mysteryBulletDict.keys():
-            mystery.mysteryEntered.stop()
-            self.sounds['mysterykilled'].play()
+            mystery.stop_sound()
+            self.play_sound('mysterykilled')
             for bullet in mysteryBulletDict[mystery]:
                 score = self.calculate_score(5, bullet.rect.x)
-            MysteryExplosion(mystery, score, self.explosionsGroup)
-            newShip = Mystery()
+                self.record(REPLAY_MYSTERY_SCORE, score)
+                self.trace(telemetry.KILL, telemetry.ORIGINS[bullet.origin], 5, score)
+            MysteryExplosion(score, (mystery.rect.x + 20, mystery.rect.y + 6), self.currentTime,
+                             self.explosionsGroup)
+            newShip = self.make_mystery()
             self.allSprites.add(newShip)
             self.mysteryGroup.add(newShip)
 
@@ -656,13 +1449,20 @@ class SpaceInvaders(object):
                         self.gameOver = True
                         self.startGame = False
 
-            self.sounds['shipexplosion'].play()
-            ShipExplosion(player, self.explosionsGroup)
+            self.play_sound('shipexplosion')
+            if player.human:
+                livesLeft = len([life for life in (self.lifePlayer1, self.lifePlayer2, self.lifePlayer3)
+                                 if life.alive()])
+                self.trace(telemetry.DEATH, telemetry.ORIGINS["human"], player.rect.x, livesLeft)
+            else:
+                self.trace(telemetry.DEATH, telemetry.ORIGINS["other"], player.rect.x,
+                           int(self.lifeOther.alive()))
+            ShipExplosion(player.rect.topleft, self.currentTime, self.explosionsGroup)
             if player.human and self.lifePlayer1.alive():
                 self.makeNewPlayer = True
             elif not player.human and self.lifeOther.alive():
                 self.makeNewOther = True
-            self.shipTimer = time.get_ticks()
+            self.shipTimer = self.currentTime
 
         if self.enemies.bottom >= 540:
             for player in sprite.groupcollide(self.playerGroup, self.enemies, True, True).keys():
@@ -689,26 +1489,42 @@ class SpaceInvaders(object):
                     self.lifeOther.kill()
                 # Reset enemy starting position
                 self.enemyPosition = ENEMY_DEFAULT_POSITION
-                self.create_game_over(time.get_ticks(), False)
+                # The game over screen is drawn by main once the step is done
+                self.enemiesLanded = True
 
             if (not self.player.alive() and not self.other.alive()):
                 self.gameOver = True
                 self.startGame = False
 
-        # sprite.groupcollide(self.bullets, self.allBlockers, True, True)
-        # sprite.groupcollide(self.enemyBullets, self.allBlockers, True, True)
-        # if self.enemies.bottom >= BLOCKERS_POSITION:
-        #     sprite.groupcollide(self.enemies, self.allBlockers, False, True)
+        if self.shields:
+            for bullets in (self.bullets, self.enemyBullets):
+                for bullet in bullets:
+                    # Only bullets at the height of the shields can hit one
+                    if (bullet.rect.bottom > BLOCKERS_POSITION
+                            and bullet.rect.top < BLOCKERS_POSITION + SHIELD_HEIGHT):
+                        for shield in self.shields:
+                            if shield.hit(bullet.rect, bullet.direction):
+                                bullet.kill()
+                                break
+            # Enemies only cover new ground when the formation moves
+            if (self.enemies.bottom >= BLOCKERS_POSITION
+                    and self.enemies.clearedMove != self.enemies.moveCount):
+                self.enemies.clearedMove = self.enemies.moveCount
+                for enemy in self.enemies:
+                    rect = enemy.rect
+                    if rect.bottom >= BLOCKERS_POSITION:
+                        for shield in self.shields:
+                            shield.clear(rect)
 
     def create_new_ship(self, createShip, currentTime, human):
         if createShip and (currentTime - self.shipTimer > 900):
             if human:
-                self.player = Ship(human)
+                self.player = Ship(human, self.mode)
                 self.allSprites.add(self.player)
                 self.playerGroup.add(self.player)
                 self.makeNewPlayer = False
             else:
-                self.other = Ship(human)
+                self.other = Ship(human, self.mode)
                 self.allSprites.add(self.other)
                 self.playerGroup.add(self.other)
                 self.makeNewOther = False
@@ -729,105 +1545,624 @@ class SpaceInvaders(object):
             Text(FONT, 30, str(self.other_score), GREEN, 500, 450).draw(self.screen)
         elif passed > 10000:
             self.mainScreen = True
-        for e in event.get():
+        for _, e in self.poll_events():
             if e.type == KEYUP and passed > 3000:
                 self.mainScreen = True
             if self.should_exit(e):
                 self.makeExit()
 
-    def main(self):
-        while True:
-            if self.mainScreen:
-                self.screen.blit(self.background, (0, 0))
-                self.titleText.draw(self.screen)
-                self.titleText2.draw(self.screen)
-                self.enemy1Text.draw(self.screen)
-                self.enemy2Text.draw(self.screen)
-                self.enemy3Text.draw(self.screen)
-                self.enemy4Text.draw(self.screen)
-                self.create_main_menu()
-                for e in event.get():
-                    if self.should_exit(e):
-                        self.makeExit()
-                    if e.type == KEYUP:
-                        # Only create blockers on a new game, not a new round
-                        # self.allBlockers = sprite.Group(self.make_blockers(0),
-                        #                                 self.make_blockers(1),
-                        #                                 self.make_blockers(2),
-                        #                                 self.make_blockers(3))
-                        self.livesGroup.add(self.lifePlayer1, self.lifePlayer2, self.lifePlayer3, self.lifeOther)
-                        self.reset(0, 0)
-                        self.startGame = True
-                        self.mainScreen = False
-
-            elif self.startGame:
-                if not self.enemies and not self.explosionsGroup:
-                    currentTime = time.get_ticks()
-                    # Reset enemy starting position
-                    self.enemyPosition = ENEMY_DEFAULT_POSITION
-                    self.create_game_over(currentTime, win=True)
-                else:
-                    currentTime = time.get_ticks()
-                    self.play_main_music(currentTime)
-                    self.screen.blit(self.background, (0, 0))
-                    #self.allBlockers.update(self.screen)
-                    self.scoreText2 = Text(FONT, 20, str(self.player_score), GREEN,
-                                           85, 5)
-                    self.scoreText.draw(self.screen)
-                    self.scoreText2.draw(self.screen)
-                    self.scoreTextO2 = Text(FONT, 20, str(self.other_score), GREEN,
-                                           485, 5)
-                    self.scoreTextO.draw(self.screen)
-                    self.scoreTextO2.draw(self.screen)
-                    self.livesTextPlayer.draw(self.screen)
-                    if not self.lifePlayer1.alive():
-                        draw.line(self.screen, RED, (238, 15), (310, 15), 3)
-                    self.livesTextOther.draw(self.screen)
-                    if not self.lifeOther.alive():
-                        draw.line(self.screen, RED, (638, 15), (710, 15), 3)
-                    draw.line(self.screen, WHITE, (400, 0), (400, 600), 1)  # middle line
-                    self.check_input()
-                    self.enemies.update(currentTime)
-                    self.allSprites.update(self.keys, currentTime)
-                    updateAI(self.other, self.enemies, self.enemyBullets, mode=mode)
-                    self.explosionsGroup.update(currentTime)
-                    self.check_collisions()
-                    self.create_new_ship(self.makeNewPlayer, currentTime, human=True)
-                    self.create_new_ship(self.makeNewOther, currentTime, human=False)
-                    self.make_enemies_shoot()
-
-            elif self.gameOver:
-                currentTime = time.get_ticks()
+    def make_view(self):
+        formation = self.enemies.bounds()
+        rightEnemy = 0
+        if formation:
+            rightEnemy = max(rightEnemy, self.enemies.rightmost_x())
+        mysteryX = mysteryDirection = None
+        for mystery in self.mysteryGroup:
+            mysteryX, mysteryDirection = mystery.rect.x, mystery.direction
+        return GameView(self.mode, self.currentTime, self.other.rect.x, self.other.rect.y,
+                        self.other.speed, self.other.direction, self.other.alive(),
+                        self.player.rect.x, rightEnemy, formation,
+                        mysteryX, mysteryDirection, BulletIndex(self.enemyBullets),
+                        self.aiBudget, self.snapshot)
+
+    def update_ai(self):
+        view = self.make_view()
+        start = ti.perf_counter()
+        action = self.aiPolicy(view)
+        elapsed = (ti.perf_counter() - start) * 1000
+        self.aiCalls += 1
+        self.aiTime += elapsed
+        if elapsed > self.aiBudget:
+            self.aiOverruns += 1
+        self.other.direction = action.direction
+        self.other.rect.x += action.move * self.other.speed
+        # Used by the next step's shoot, where the AI fires
+        self.aiFire = action.fire
+        self.trace(telemetry.AI_DECISION, action.move, action.direction,
+                   -1 if action.fire is None else int(action.fire))
+
+    def step(self, currentTime, keys, humanShoot=False):
+        # Advances the simulation by one frame; never draws or polls input
+        if self.recorder:
+            self.recorder.step(currentTime, keys, humanShoot)
+        self.currentTime = currentTime
+        self.keys = keys
+        prof = self.profiler
+        self.shoot(humanShoot)
+        if prof:
+            prof.mark('shoot')
+        self.enemies.update(currentTime)
+        if prof:
+            prof.mark('enemies')
+        self.playerGroup.update(keys)
+        self.mysteryGroup.update(keys, currentTime)
+        self.bullets.update()
+        self.enemyBullets.update()
+        if prof:
+            prof.mark('sprites')
+        self.update_ai()
+        if prof:
+            prof.mark('ai')
+        self.explosionsGroup.update(currentTime)
+        if prof:
+            prof.mark('explosions')
+        self.check_collisions()
+        self.create_new_ship(self.makeNewPlayer, currentTime, human=True)
+        self.create_new_ship(self.makeNewOther, currentTime, human=False)
+        if prof:
+            prof.mark('collisions')
+        self.make_enemies_shoot()
+        if prof:
+            prof.mark('enemy_fire')
+        if self.telemetry:
+            self.telemetry.record(currentTime, telemetry.FRAME, self.player.rect.x, self.other.rect.x,
+                                  self.player.alive() | self.other.alive() << 1)
+
+    def presented(self):
+        # Called once a frame is on screen; times the key presses it shows
+        now = ti.perf_counter()
+        if self.firstFrame is None:
+            self.report_startup(now)
+        for action, stamp, handled in self.unpresented:
+            latency = (now - stamp) * 1000
+            self.inputLatencies[action].append(latency)
+            self.trace(telemetry.INPUT_LATENCY, action, min(int(latency * 10), 32767),
+                       min(int((handled - stamp) * 10000), 32767))
+        del self.unpresented[:]
+
+    def latency_summary(self):
+        # (action, mean ms, p95 ms, presses) over the session
+        return [(action, sum(latencies) / max(len(latencies), 1), percentile(latencies, 0.95), len(latencies))
+                for action, latencies in zip(LATENCY_ACTIONS, self.inputLatencies)]
+
+    def trace(self, kind, a=0, b=0, c=0):
+        if self.telemetry:
+            self.telemetry.record(self.currentTime, kind, a, b, c)
+
+    def render(self):
+        # Only the areas drawn last frame are restored from the backdrop and only
+        # those plus this frame's areas are returned for display.update
+        for shield in self.shields:
+            # Damage goes into the backdrop, then to the screen like any dirty area
+            for rect in shield.damaged:
+                self.backdrop.blit(self.background, rect, rect)
+                shield.draw(self.backdrop, rect)
+                self.dirtyRects.append(rect)
+            shield.damaged = []
+        # Lives are only ever lost during a game, so their count tells when
+        # the HUD changed
+        hud = (self.player_score, self.other_score, len(self.livesGroup))
+        if hud != self.shownHud:
+            self.draw_hud()
+            self.dirtyRects.append(HUD_AREA)
+            self.shownHud = hud
+        if self.fullRedraw:
+            self.screen.blit(self.backdrop, (0, 0))
+            updated = [self.screen.get_rect()]
+            self.fullRedraw = False
+        else:
+            for rect in self.dirtyRects:
+                self.screen.blit(self.backdrop, rect, rect)
+            updated = self.dirtyRects
+        drawn = [self.enemies.draw(self.screen)]
+        for sprite_ in self.allSprites:
+            drawn.append(sprite_.draw(self.screen))
+        for explosion in self.explosionsGroup:
+            drawn.append(explosion.draw(self.screen))
+        if self.profiler and self.profiler.overlay:
+            drawn.extend(self.draw_profile())
+        self.dirtyRects = [rect for rect in drawn if rect]
+        return updated + self.dirtyRects
+
+    def draw_profile(self):
+        if not self.overlayLines or self.profiler.frames % OVERLAY_REFRESH == 0:
+            # The font is not monospaced, so every cell is placed on its own
+            font = load_font(FONT, 12)
+            x, y = OVERLAY_POSITION
+            self.overlayLines = []
+            for row in self.profiler.table():
+                for cell, offset in zip(row, OVERLAY_COLUMNS):
+                    self.overlayLines.append((font.render(cell, False, YELLOW), (x + offset, y)))
+                y += font.get_linesize()
+        return [self.screen.blit(surface, position) for surface, position in self.overlayLines]
+
+    def advance(self, currentTime):
+        # Runs one fixed step of whichever screen is showing. Returns whether
+        # the game screen has to be rendered; menus and game over screens are
+        # drawn as they go.
+        self.currentTime = currentTime
+        prof = self.profiler
+        if self.mainScreen:
+            if self.turbo:
+                # Nobody is watching; go straight to the next game
+                self.log_game()
+                self.start_game()
+                return False
+            self.screen.blit(self.background, (0, 0))
+            self.titleText.draw(self.screen)
+            self.titleText2.draw(self.screen)
+            self.enemy1Text.draw(self.screen)
+            self.enemy2Text.draw(self.screen)
+            self.enemy3Text.draw(self.screen)
+            self.enemy4Text.draw(self.screen)
+            self.create_main_menu()
+            for _, e in self.poll_events():
+                if self.should_exit(e):
+                    self.makeExit()
+                if e.type == KEYUP:
+                    self.log_game()
+                    self.start_game()
+
+        elif self.startGame:
+            if not self.enemies and not self.explosionsGroup:
                 # Reset enemy starting position
                 self.enemyPosition = ENEMY_DEFAULT_POSITION
-                self.create_game_over(currentTime)
+                self.create_game_over(currentTime, win=True)
+            else:
+                self.play_main_music(currentTime)
+                humanShoot = self.check_input()
+                if prof:
+                    prof.mark('input')
+                self.step(currentTime, self.keys, humanShoot)
+                if not self.enemiesLanded:
+                    return True
+                self.create_game_over(currentTime, False)
+
+        elif self.gameOver:
+            # Reset enemy starting position
+            self.enemyPosition = ENEMY_DEFAULT_POSITION
+            self.create_game_over(currentTime)
+        return False
 
-            display.update()
-            self.clock.tick(60)
+    def main(self):
+        # The simulation always advances in FRAME_TIME steps of a simulated
+        # clock, however fast frames are drawn. Each frame runs the steps that
+        # fell due since the last one (at most catchUp, after which the game
+        # slows down instead of skipping ahead) and then renders once. The cap
+        # grows at low frame rates, so that every frame can still cover its
+        # steps with some room to spare.
+        # In turbo mode steps run back to back and a frame is only drawn every
+        # 1/renderFps seconds of wall time. Input is handled by the first step
+        # after the wait, right before the frame is rendered and shown.
+        self.open_window()
+        last = time.get_ticks()
+        # A restored game carries on from its own clock
+        start = self.currentTime if self.startGame else last
+        self.frameStart = ti.perf_counter()
+        catchUp = max(MAX_CATCH_UP, int(math.ceil(1000.0 / (FRAME_TIME * self.renderFps))) + 1)
+        steps = 0
+        lag = 0.0
+        while True:
+            prof = self.profiler
+            if prof:
+                prof.begin()
+            now = time.get_ticks()
+            lag = min(lag + now - last, catchUp * FRAME_TIME)
+            last = now
+            due = int(lag // FRAME_TIME)
+            lag -= due * FRAME_TIME
+            drawGame = None
+            while self.turbo or due > 0:
+                steps += 1
+                due -= 1
+                drawGame = self.advance(int(start + steps * FRAME_TIME))
+                if not drawGame:
+                    self.fullRedraw = True
+                if self.turbo and time.get_ticks() - now >= 1000.0 / self.renderFps:
+                    break
+
+            if drawGame:
+                updated = self.render()
+                if prof:
+                    prof.mark('render')
+                display.update(updated)
+                self.presented()
+            elif drawGame is not None:
+                # Menus and game over screens are drawn in full
+                display.update()
+                self.presented()
+            if prof:
+                prof.mark('display')
+            if ti.perf_counter() - self.savedAt >= AUTOSAVE_INTERVAL:
+                if self.recorder:
+                    self.recorder.flush()
+                if self.snapshots and self.startGame and not self.turbo:
+                    self.snapshots.save(self.snapshot())
+                self.savedAt = ti.perf_counter()
+            self.wait_for_frame()
+            if prof:
+                prof.mark('wait')
+                prof.end(bool(drawGame))
+
+    def wait_for_frame(self):
+        # Sleeps out the rest of the frame, like Clock.tick, but in
+        # INPUT_POLL_MS slices so that events get stamped close to when they
+        # arrive rather than when the next frame starts. The last slice may
+        # overshoot the frame by up to a slice; the next frame is still timed
+        # from where this one should have ended, so that does not add up.
+        now = ti.perf_counter()
+        if not self.turbo:
+            frameEnd = self.frameStart + 1.0 / self.renderFps
+            while now < frameEnd:
+                self.collect_input()
+                time.wait(INPUT_POLL_MS)
+                now = ti.perf_counter()
+            self.collect_input()
+            if now - frameEnd < INPUT_POLL_MS / 1000.0:
+                now = frameEnd
+        self.frameStart = now
+
+    def snapshot(self):
+        # The complete state of a started game as bytes, for restore. Input,
+        # recording, telemetry, AI statistics and the display are not state.
+        lives = (self.lifePlayer1, self.lifePlayer2, self.lifePlayer3, self.lifeOther)
+        order = bytearray()
+        records = []
+        for s in self.allSprites:
+            if s is self.player:
+                order.append(ORDER_PLAYER)
+            elif s is self.other:
+                order.append(ORDER_OTHER)
+            elif isinstance(s, Mystery):
+                order.append(ORDER_MYSTERY)
+                records.append(SNAPSHOT_MYSTERY.pack(s.rect.x, s.rect.y, s.direction, s.timer,
+                                                     s.playSound, s.visible))
+            else:
+                order.append(ORDER_BULLET)
+                records.append(SNAPSHOT_BULLET.pack(s.rect.x, s.rect.y, s.direction, s.speed,
+                                                    SNAPSHOT_ORIGINS.index(s.origin)))
+        for explosion in self.explosionsGroup:
+            if isinstance(explosion, EnemyExplosion):
+                kind, value, position = 0, explosion.row, explosion.rect.topleft
+            elif isinstance(explosion, MysteryExplosion):
+                kind, value, position = 1, explosion.score, explosion.position
+            else:
+                kind, value, position = 2, 0, explosion.rect.topleft
+            records.append(SNAPSHOT_EXPLOSION.pack(kind, value, position[0], position[1],
+                                                   explosion.timer, explosion.passed))
+        version, state, gauss = self.random.getstate()
+        enemies = self.enemies
+        return b''.join([
+            SNAPSHOT_GAME.pack(
+                SNAPSHOT_MAGIC, SNAPSHOT_VERSION, self.mode.encode(), self.seed, self.useShields,
+                self.currentTime, self.player_score, self.other_score, self.humanKillL,
+                self.humanKillR, self.otherKillL, self.otherKillR, self.timer, self.noteTimer,
+                self.shipTimer, self.enemyPosition, self.noteIndex, self.makeNewPlayer,
+                self.makeNewOther, self.enemiesLanded, self.startGame, self.mainScreen,
+                self.gameOver, -1 if self.aiFire is None else int(self.aiFire),
+                sum(1 << i for i, life in enumerate(lives) if life.alive()),
+                self.player.rect.x, self.player.rect.y, self.other.rect.x, self.other.rect.y,
+                self.other.direction, len(order), len(self.explosionsGroup), len(self.shields)),
+            SNAPSHOT_RANDOM.pack(version, *(state + (gauss is not None, gauss or 0.0))),
+            SNAPSHOT_FORMATION.pack(
+                enemies.columns, enemies.rows, enemies.moveTime, enemies.moveCount, enemies.timer,
+                enemies.startY, enemies.originX, enemies.originY, enemies.bottom,
+                enemies.leftAliveColumn, enemies.rightAliveColumn),
+            bytes(bytearray(enemy is not None for row in enemies.enemies for enemy in row)),
+            bytes(order)] + records + [bytes(shield.bitmap) for shield in self.shields])
+
+    def restore(self, data):
+        # Puts the game back in the state a snapshot was taken in, whether or
+        # not this game has been started
+        (magic, version, mode, self.seed, self.useShields, self.currentTime,
+         self.player_score, self.other_score, self.humanKillL, self.humanKillR,
+         self.otherKillL, self.otherKillR, self.timer, self.noteTimer, self.shipTimer,
+         self.enemyPosition, noteIndex, self.makeNewPlayer, self.makeNewOther,
+         self.enemiesLanded, self.startGame, self.mainScreen, self.gameOver, aiFire, lives,
+         playerX, playerY, otherX, otherY, otherDirection, sprites, explosions,
+         shields) = SNAPSHOT_GAME.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError("Not a version {} snapshot".format(SNAPSHOT_VERSION))
+        offset = SNAPSHOT_GAME.size
+        self.mode = mode.decode()
+        if self.screen is not None and not self.turbo:
+            self.create_audio()
+        self.noteIndex = noteIndex
+        self.aiFire = None if aiFire < 0 else bool(aiFire)
+        self.livesGroup.empty()
+        for i, life in enumerate((self.lifePlayer1, self.lifePlayer2, self.lifePlayer3, self.lifeOther)):
+            if lives & (1 << i):
+                self.livesGroup.add(life)
+
+        randomState = SNAPSHOT_RANDOM.unpack_from(data, offset)
+        offset += SNAPSHOT_RANDOM.size
+
+        (columns, rows, moveTime, moveCount, timer, startY, originX, originY, bottom,
+         leftAliveColumn, rightAliveColumn) = SNAPSHOT_FORMATION.unpack_from(data, offset)
+        offset += SNAPSHOT_FORMATION.size
+        enemies = EnemiesGroup(columns, rows, startY, timer, self.random)
+        for row in range(rows):
+            for column in range(columns):
+                if data[offset + row * columns + column]:
+                    enemies.add(Enemy(row, column))
+        offset += rows * columns
+        enemies.moveTime = moveTime
+        enemies.moveCount = moveCount
+        enemies.originX = originX
+        enemies.originY = originY
+        enemies.bottom = bottom
+        enemies.leftAliveColumn = leftAliveColumn
+        enemies.rightAliveColumn = rightAliveColumn
+        enemies._aliveColumns = [column for column in range(columns) if enemies.columnCounts[column]]
+        self.enemies = enemies
 
-    def makeExit(self):
-        if mode == "c":
+        self.bulletPool.reclaim()
+        self.player = Ship(True, self.mode)
+        self.player.rect.topleft = (playerX, playerY)
+        self.other = Ship(False, self.mode)
+        self.other.rect.topleft = (otherX, otherY)
+        self.other.direction = otherDirection
+        self.allSprites = sprite.Group()
+        self.playerGroup = sprite.Group()
+        self.mysteryGroup = sprite.Group()
+        self.bullets = sprite.Group()
+        self.enemyBullets = sprite.Group()
+        self.mysteryShip = None
+        order = data[offset:offset + sprites]
+        offset += sprites
+        for kind in bytearray(order):
+            if kind == ORDER_PLAYER:
+                self.player.add(self.allSprites, self.playerGroup)
+            elif kind == ORDER_OTHER:
+                self.other.add(self.allSprites, self.playerGroup)
+            elif kind == ORDER_MYSTERY:
+                x, y, direction, timer, playSound, visible = SNAPSHOT_MYSTERY.unpack_from(data, offset)
+                offset += SNAPSHOT_MYSTERY.size
+                # Takes a direction from the random generator, which is restored last
+                mystery = Mystery(timer, self.random, self.soundBank)
+                mystery.rect.topleft = (x, y)
+                mystery.direction = direction
+                mystery.playSound = playSound
+                mystery.visible = visible
+                mystery.add(self.allSprites, self.mysteryGroup)
+                if self.mysteryShip is None:
+                    self.mysteryShip = mystery
+            else:
+                x, y, direction, speed, origin = SNAPSHOT_BULLET.unpack_from(data, offset)
+                offset += SNAPSHOT_BULLET.size
+                if origin == SNAPSHOT_ORIGINS.index("enemy"):
+                    self.bulletPool.acquire(x, y, direction, speed, 'enemylaser', "enemy",
+                                            self.enemyBullets, self.allSprites)
+                else:
+                    self.bulletPool.acquire(x, y, direction, speed, 'laser', SNAPSHOT_ORIGINS[origin],
+                                            self.bullets, self.allSprites)
+
+        self.explosionsGroup = sprite.Group()
+        for _ in range(explosions):
+            kind, value, x, y, timer, passed = SNAPSHOT_EXPLOSION.unpack_from(data, offset)
+            offset += SNAPSHOT_EXPLOSION.size
+            if kind == 0:
+                explosion = EnemyExplosion(value, (x, y), timer, self.explosionsGroup)
+            elif kind == 1:
+                explosion = MysteryExplosion(value, (x, y), timer, self.explosionsGroup)
+            else:
+                explosion = ShipExplosion((x, y), timer, self.explosionsGroup)
+            explosion.passed = passed
+
+        self.shields = []
+        for number in range(shields):
+            shield = Shield(number)
+            shield.bitmap[:] = data[offset:offset + len(shield.bitmap)]
+            offset += len(shield.bitmap)
+            self.shields.append(shield)
+
+        self.random.setstate((randomState[0], randomState[1:626],
+                              randomState[627] if randomState[626] else None))
+        if self.screen is None:
+            self.keys = defaultdict(bool)
+        else:
+            self.keys = key.get_pressed()
+            self.make_backdrop()
+            self.dirtyRects = []
+
+    def clone(self):
+        # A headless copy of the game in its current state, e.g. to play
+        # ahead in; shares nothing with this game and records nothing
+        game = SpaceInvaders(self.mode, headless=True, seed=self.seed, aiPolicy=self.aiPolicy,
+                             aiBudget=self.aiBudget, shields=self.useShields)
+        game.restore(self.snapshot())
+        return game
+
+    def load(self, path):
+        with open(path, 'rb') as f:
+            self.restore(f.read())
+        # Snapshots are only taken during a game, which is logged when it ends
+        self.unlogged = True
+
+    def results(self):
+        # (Score, Survived, Enemies Killed on Left, Enemies Killed on Right)
+        human = (self.player_score, self.lifePlayer1.alive(),
+                 self.humanKillL, self.humanKillR)
+        other = (self.other_score, self.lifeOther.alive(),
+                 self.otherKillL, self.otherKillR)
+        return human, other
+
+    def ai_stats(self):
+        # (Calls, Calls Over Budget, Mean ms per Call) of the AI policy
+        return self.aiCalls, self.aiOverruns, self.aiTime / max(self.aiCalls, 1)
+
+    def log_mode(self):
+        if self.mode == "c":
             logs.write("Game against: cooperative player\n")
-        elif mode == "d":
+        elif self.mode == "d":
             logs.write("Game against: uncooperative player\n")
-        elif mode == "p":
+        elif self.mode == "p":
             logs.write("Game: practice round\n")
 
+    def log_results(self, human, other):
+        logs.write("(Score, Survived, Enemies Killed on Left, Enemies Killed on Right)\n")
+        logs.write("Human: (" + ", ".join(str(value) for value in human) + ")\n")
+        logs.write("AI: (" + ", ".join(str(value) for value in other) + ")\n\n")
+
+    def log_game(self):
+        # Every game of a session that ends before the session does (turbo
+        # mode plays many) gets its own entry; the next one starts here
+        global startTime
+        if not self.unlogged:
+            return
+        self.log_mode()
+        logs.write("Duration (seconds): " + str(self.log_duration()) + "\n")
+        self.log_results(*self.results())
+        logs.write("Date/Time: " + datetime.now().strftime("%m/%d/%Y %H:%M:%S") + "\n")
+        startTime = ti.time()
+        self.unlogged = False
+
+    def log_duration(self):
+        # Seconds since the entry was started; turbo games run faster than the
+        # clock, so they are timed in game time
+        if self.turbo:
+            return int((self.currentTime - self.startedAt) // 1000)
+        return int(ti.time() - startTime)
 
-        duration = str(int(ti.time() - startTime))
+    def makeExit(self):
+        self.log_mode()
+        duration = str(self.log_duration())
+        human, other = self.results()
         logs.write("Duration (seconds): " + duration + "\n")
-        logs.write("(Score, Survived, Enemies Killed on Left, Enemies Killed on Right)\n")
-        logs.write("Human: (" + str(self.player_score) + ", " + str(self.lifePlayer1.alive())
-                   + ", " + str(self.humanKillL) + ", " + str(self.humanKillR) + ")\n")
-        logs.write("AI: (" + str(self.other_score) + ", " + str(self.lifeOther.alive())
-                   + ", " + str(self.otherKillL) + ", " + str(self.otherKillR) + ")\n\n")
+        if self.firstFrame is not None:
+            logs.write("Time to first frame (ms): {:.0f}\n".format(self.firstFrame))
+        logs.write("Input latency in ms (mean, p95, presses): " + ", ".join(
+            "{} ({:.1f}, {:.1f}, {})".format(*row) for row in self.latency_summary()) + "\n")
+        logs.write("AI policy (calls, over the {} ms budget, mean ms): ({}, {}, {:.3f})\n".format(
+            self.aiBudget, *self.ai_stats()))
+        self.log_results(human, other)
+        if self.recorder:
+            self.recorder.end((human, other))
+        if self.profiler and self.profiler.frames:
+            self.profiler.dump(PROFILE_PATH + sessionName + '.txt')
+        if self.snapshots:
+            self.snapshots.close()
         sys.exit()
 
+
+def play_headless(game, humanPolicy=None, maxFrames=MAX_HEADLESS_FRAMES):
+    # Plays a headless game as fast as the CPU allows on a simulated 60 Hz clock.
+    # humanPolicy(game, keys) may press keys in place and returns whether to fire;
+    # without one the human ship stays idle. Returns the number of steps.
+    game.start_game()
+    keys = defaultdict(bool)
+    frames = 0
+    prof = game.profiler
+    while frames < maxFrames and game.is_running():
+        if prof:
+            prof.begin()
+        humanShoot = False
+        if humanPolicy is not None:
+            humanShoot = humanPolicy(game, keys)
+        if prof:
+            prof.mark('input')
+        frames += 1
+        game.step(int(frames * FRAME_TIME), keys, humanShoot)
+        if prof:
+            prof.end()
+    return frames
+
+
+def run_headless(mode="d", seed=None, humanPolicy=None, maxFrames=MAX_HEADLESS_FRAMES,
+                 aiPolicy=updateAI, aiBudget=AI_BUDGET_MS, shields=False):
+    game = SpaceInvaders(mode, headless=True, seed=seed, aiPolicy=aiPolicy, aiBudget=aiBudget,
+                         shields=shields)
+    frames = play_headless(game, humanPolicy, maxFrames)
+    human, other = game.results()
+    return human, other, frames
+
+
+def parse_mode(argv):
+    mode = "d"
+    if len(argv) > 1:
+        if argv[1] == "c":
+            mode = "c"
+        elif argv[1] == "p":
+            mode = "p"
+    return mode
+
+
+IMPORT_TIME = ti.perf_counter()
+
 if __name__ == '__main__':
+    mode = parse_mode(sys.argv)
+    aiPolicy = updateAI
+    aiBudget = AI_BUDGET_MS
+    if '--planner' in sys.argv:
+        from planner import PLANNER_BUDGET_MS, RolloutPlanner
+        aiPolicy = RolloutPlanner()
+        aiBudget = PLANNER_BUDGET_MS
+    if '--headless' in sys.argv:
+        start = ti.time()
+        game = SpaceInvaders(mode, headless=True, shields='--shields' in sys.argv, aiPolicy=aiPolicy,
+                             aiBudget=aiBudget)
+        if '--profile' in sys.argv:
+            game.profiler = FrameProfiler()
+        frames = play_headless(game)
+        elapsed = ti.time() - start
+        human, other = game.results()
+        print("Human: {}".format(human))
+        print("AI: {}".format(other))
+        print("{} steps in {:.2f}s ({:.0f} steps/s)".format(frames, elapsed, frames / elapsed))
+        calls, overruns, mean = game.ai_stats()
+        print("AI policy: {:.3f} ms per call, {} of {} calls over the {} ms budget".format(
+            mean, overruns, calls, game.aiBudget))
+        print("Assets: {hits} hits, {misses} misses, {variants} scaled variants "
+              "({variantBytes} bytes, sources {sourceBytes} bytes)".format(**asset_stats()))
+        if aiPolicy is not updateAI:
+            print(aiPolicy.summary())
+        if game.profiler:
+            print("\n".join(game.profiler.summary()))
+        sys.exit()
+
+    renderFps = RENDER_FPS
+    if '--fps' in sys.argv:
+        try:
+            renderFps = int(sys.argv[sys.argv.index('--fps') + 1])
+        except (IndexError, ValueError):
+            renderFps = 0
+        if renderFps <= 0:
+            sys.exit("--fps needs a whole number of frames per second above 0, e.g. --fps 30")
+
     logs = open("game_logs/other_logs.txt", "a")
     logs.write("Date/Time: " + datetime.now().strftime("%m/%d/%Y %H:%M:%S") + "\n")
     # variables for log
     startTime = ti.time()
 
-    game = SpaceInvaders()
+    game = SpaceInvaders(mode, shields='--shields' in sys.argv, aiPolicy=aiPolicy, aiBudget=aiBudget)
+    game.turbo = '--turbo' in sys.argv
+    game.renderFps = renderFps
+    for path in (REPLAY_PATH, TELEMETRY_PATH, PROFILE_PATH, SNAPSHOT_PATH):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+    sessionName = datetime.now().strftime("%Y%m%d_%H%M%S") + "_{}".format(mode)
+    game.snapshots = SnapshotWriter(SNAPSHOT_PATH + sessionName + '.sisn')
+    if '--resume' in sys.argv:
+        resumePath = sys.argv[sys.argv.index('--resume') + 1]
+        game.open_window()
+        game.load(resumePath)
+        # This session keeps its own snapshot from here on
+        os.remove(resumePath)
+    # A replay re-runs a session from its first game with updateAI, so a
+    # resumed session or one against the planner is not recorded
+    if aiPolicy is updateAI and '--resume' not in sys.argv:
+        game.recorder = ReplayRecorder(REPLAY_PATH + sessionName + '.sirp', game.seed, mode,
+                                       game.useShields)
+    game.telemetry = telemetry.Telemetry(TELEMETRY_PATH + sessionName + '.sitl')
+    game.profiler = FrameProfiler()
     game.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+# Space Invaders - 2-Playered
+# Session telemetry. The game thread appends fixed-width events to a
+# preallocated ring buffer; a background thread drains it every FLUSH_INTERVAL
+# seconds into an append-only columnar file, one block per flush with each
+# column stored contiguously. Only this thread touches the disk, so a crash
+# loses at most the last interval.
+#
+#   python3 telemetry.py game_logs/telemetry/<session>.sitl
+
+import atexit
+import struct
+import sys
+import threading
+from array import array
+from collections import Counter
+
+TELEMETRY_MAGIC = b'SITL'
+BLOCK_MAGIC = b'SITB'
+BLOCK_HEADER = struct.Struct('<4sI')  # magic, rows
+FLUSH_INTERVAL = 0.5
+CAPACITY = 1 << 16  # events; a power of two so indexes can be masked
+
+# Column name and array typecode; every event fills all of them
+COLUMNS = (('time', 'I'), ('kind', 'B'), ('a', 'h'), ('b', 'h'), ('c', 'h'))
+
+# Event kinds, and what a, b and c hold for each
+FRAME = 1  # human x, AI x, ships alive (bit 0 human, bit 1 AI)
+SHOT = 2  # origin, x, y
+KILL = 3  # shooter origin, row (5 for the mystery), column or mystery score
+DEATH = 4  # origin, x, lives left
+AI_DECISION = 5  # move, direction, fire (-1 for the default rule)
+# action (0 fire, 1 left, 2 right), input-to-present and queued time in 0.1 ms
+INPUT_LATENCY = 6
+KIND_NAMES = {FRAME: 'frame', SHOT: 'shot', KILL: 'kill', DEATH: 'death', AI_DECISION: 'ai',
+              INPUT_LATENCY: 'latency'}
+ORIGINS = {'human': 0, 'other': 1, 'enemy': 2}
+
+
+class Telemetry(object):
+    def __init__(self, path, capacity=CAPACITY, interval=FLUSH_INTERVAL):
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.columns = [array(code, [0]) * capacity for _, code in COLUMNS]
+        self.time, self.kind, self.a, self.b, self.c = self.columns
+        # head is only written by the game thread, tail only by the flusher
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            names = ','.join('{}:{}'.format(name, code) for name, code in COLUMNS).encode()
+            self.file.write(TELEMETRY_MAGIC + struct.pack('<H', len(names)) + names)
+            self.file.flush()
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='telemetry')
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.close)
+
+    def record(self, time, kind, a=0, b=0, c=0):
+        i = self.head & self.mask
+        self.time[i] = time
+        self.kind[i] = kind
+        self.a[i] = a
+        self.b[i] = b
+        self.c[i] = c
+        self.head += 1
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        head = self.head
+        tail = self.tail
+        if head - tail > self.capacity:
+            # The game outran the flusher; the oldest events were overwritten
+            self.dropped += head - tail - self.capacity
+            tail = head - self.capacity
+        rows = head - tail
+        if not rows:
+            return
+        start = tail & self.mask
+        end = start + rows
+        self.file.write(BLOCK_HEADER.pack(BLOCK_MAGIC, rows))
+        for column in self.columns:
+            if end <= self.capacity:
+                column[start:end].tofile(self.file)
+            else:
+                column[start:].tofile(self.file)
+                column[:end - self.capacity].tofile(self.file)
+        self.file.flush()
+        self.tail = head
+
+    def close(self):
+        if self.stopped.is_set():
+            return
+        self.stopped.set()
+        self.thread.join()
+        self.flush()
+        self.file.close()
+
+
+def read_telemetry(path):
+    # Returns {column name: array} with every block concatenated
+    with open(path, 'rb') as f:
+        if f.read(4) != TELEMETRY_MAGIC:
+            raise ValueError("{} is not a telemetry file".format(path))
+        size, = struct.unpack('<H', f.read(2))
+        layout = [field.split(':') for field in f.read(size).decode().split(',')]
+        columns = {name: array(code) for name, code in layout}
+        while True:
+            header = f.read(BLOCK_HEADER.size)
+            if len(header) < BLOCK_HEADER.size:
+                break
+            magic, rows = BLOCK_HEADER.unpack(header)
+            if magic != BLOCK_MAGIC:
+                raise ValueError("corrupt block in {}".format(path))
+            block = []
+            try:
+                for _, code in layout:
+                    values = array(code)
+                    values.fromfile(f, rows)
+                    block.append(values)
+            except EOFError:
+                break  # last block was cut short by a crash
+            for (name, _), values in zip(layout, block):
+                columns[name].extend(values)
+        return columns
+
+
+if __name__ == '__main__':
+    columns = read_telemetry(sys.argv[1])
+    kinds = Counter(KIND_NAMES.get(kind, kind) for kind in columns['kind'])
+    times = columns['time']
+    print("{} events over {:.1f}s of play".format(len(times), (max(times) - min(times)) / 1000.0 if times else 0))
+    for name, count in sorted(kinds.items()):
+        print("{}: {}".format(name, count))
+    latencies = sorted(latency / 10.0 for kind, latency in zip(columns['kind'], columns['b'])
+                       if kind == INPUT_LATENCY)
+    if latencies:
+        print("input latency: mean {:.1f} ms, p95 {:.1f} ms, max {:.1f} ms".format(
+            sum(latencies) / len(latencies), latencies[int(0.95 * (len(latencies) - 1))], latencies[-1]))
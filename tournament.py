@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+# Space Invaders - 2-Playered
+# Tournament runner: plays many seeded headless matches across all cores and
+# aggregates the (Score, Survived, Enemies Killed on Left, Enemies Killed on
+# Right) tuples that makeExit logs for real games, and how often the AI policy
+# went over its --ai-budget. The report is loganalytics.Totals, so it reads
+# like the one for the logged sessions.
+#
+#   python3 tournament.py --modes c d p --matches 200 --output results.csv
+#
+# Policies are given as module:name, e.g. --ai spaceinvaders:updateAI. An AI
+# policy takes a GameView and returns an AIAction; if name is a class, each
+# match gets a fresh instance of it.
+# Match n of a run always uses seed --seed + n, and results are streamed in
+# match order, so the output does not depend on --workers.
+
+import argparse
+import csv
+import importlib
+import inspect
+import sys
+from multiprocessing import Pool, cpu_count
+
+from loganalytics import Totals
+from spaceinvaders import AI_BUDGET_MS, FRAME_TIME, MAX_HEADLESS_FRAMES, SpaceInvaders, play_headless
+
+FIELDS = ['mode', 'seed',
+          'human_score', 'human_survived', 'human_killed_left', 'human_killed_right',
+          'ai_score', 'ai_survived', 'ai_killed_left', 'ai_killed_right',
+          'duration', 'ai_calls', 'ai_overruns', 'ai_mean_ms']
+
+
+def resolve(name):
+    if not name:
+        return None
+    module, _, attr = name.partition(':')
+    policy = getattr(importlib.import_module(module), attr)
+    if inspect.isclass(policy):
+        policy = policy()
+    return policy
+
+
+def play_match(task):
+    mode, seed, ai, human, maxFrames, aiBudget, shields = task
+    game = SpaceInvaders(mode, headless=True, seed=seed, aiPolicy=resolve(ai), aiBudget=aiBudget,
+                         shields=shields)
+    frames = play_headless(game, resolve(human), maxFrames)
+    humanResult, otherResult = game.results()
+    calls, overruns, mean = game.ai_stats()
+    return ((mode, seed) + humanResult + otherResult
+            + (round(frames * FRAME_TIME / 1000.0, 3), calls, overruns, round(mean, 3)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run seeded headless Space Invaders matches.")
+    parser.add_argument('--modes', nargs='+', default=['c', 'd', 'p'], choices=['c', 'd', 'p'])
+    parser.add_argument('--matches', type=int, default=100, help="matches per mode")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the first match")
+    parser.add_argument('--workers', type=int, default=cpu_count())
+    parser.add_argument('--ai', default='spaceinvaders:updateAI')
+    parser.add_argument('--ai-budget', type=float, default=AI_BUDGET_MS, help="ms per AI policy call")
+    parser.add_argument('--human', default=None, help="humanPolicy(game, keys); idle if omitted")
+    parser.add_argument('--max-frames', type=int, default=MAX_HEADLESS_FRAMES)
+    parser.add_argument('--shields', action='store_true', help="play with shields")
+    parser.add_argument('--output', default=None, help="per-match CSV (default: stdout)")
+    args = parser.parse_args(argv)
+
+    tasks = [(mode, args.seed + n, args.ai, args.human, args.max_frames, args.ai_budget, args.shields)
+             for mode in args.modes for n in range(args.matches)]
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    writer = csv.writer(out)
+    writer.writerow(FIELDS)
+    report = Totals(aiBudget=args.ai_budget)
+
+    pool = Pool(args.workers) if args.workers > 1 else None
+    try:
+        if pool:
+            rows = pool.imap(play_match, tasks, chunksize=max(1, len(tasks) // (args.workers * 16)))
+        else:
+            rows = map(play_match, tasks)
+        for row in rows:
+            writer.writerow(row)
+            out.flush()
+            report.add(row[0], row[10], row[2:6], row[6:10], row[11:14])
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+        if args.output:
+            out.close()
+
+    report.write(sys.stdout if args.output else sys.stderr)
+
+
+if __name__ == '__main__':
+    main()